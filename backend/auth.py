@@ -1,26 +1,53 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pymongo.database import Database
-from bson import ObjectId
 import os
 from dotenv import load_dotenv
 
-from database import get_database
+from database import get_users
+from metrics import timed
 from models import User, TokenData
+from repositories import UserRepository
+from ttl_cache import TTLCache
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Resolved users are cached per token; keep the TTL short since invalidation is per process
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+# Hashes with a different cost factor are transparently rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash/verify calls allowed to wait for a worker before new ones are rejected with 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 security = HTTPBearer()
 
+class PasswordHashStats:
+    pending: int = 0
+    completed: int = 0
+    rejected: int = 0
+
+password_hash_stats = PasswordHashStats()
+_principal_cache = TTLCache(AUTH_USER_CACHE_MAX_ENTRIES, AUTH_USER_CACHE_TTL_SECONDS)
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -29,6 +56,69 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+        )
+    return _hash_executor
+
+def shutdown_password_executor():
+    """Stop the password hashing workers"""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+        _hash_executor = None
+
+def _timed_call(stage: str, func, *args):
+    with timed(stage):
+        return func(*args)
+
+async def _run_password_task(stage: str, func, *args):
+    """
+    Run a bcrypt call on the hashing pool so it does not block the event loop.
+    Rejects with 503 once the pool and its queue are full.
+    """
+    if password_hash_stats.pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        password_hash_stats.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    password_hash_stats.pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_executor(), _timed_call, stage, func, *args)
+    finally:
+        password_hash_stats.pending -= 1
+        password_hash_stats.completed += 1
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the hashing pool"""
+    return await _run_password_task("bcrypt_hash", pwd_context.hash, password)
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password on the hashing pool. Also returns a replacement hash
+    when the stored one was made with a different cost factor.
+    """
+    return await _run_password_task("bcrypt_verify", pwd_context.verify_and_update, plain_password, hashed_password)
+
+def get_password_hash_stats() -> dict:
+    """Password hashing pool utilisation"""
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "pending": password_hash_stats.pending,
+        "queue_depth": max(0, password_hash_stats.pending - PASSWORD_HASH_WORKERS),
+        "completed": password_hash_stats.completed,
+        "rejected": password_hash_stats.rejected,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -40,25 +130,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_user_by_email(db: Database, email: str) -> Optional[User]:
-    user_data = db.users.find_one({"email": email})
-    if user_data:
-        user_data["_id"] = str(user_data["_id"])  # Convert ObjectId to string
-        return User(**user_data)
-    return None
-
-def authenticate_user(db: Database, email: str, password: str) -> Optional[User]:
+async def authenticate_user(users: UserRepository, email: str, password: str) -> Optional[User]:
     """Authenticate user with email and password"""
-    user = get_user_by_email(db, email)
+    with timed("user_lookup"):
+        user = await users.find_by_email(email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        # The configured cost factor changed since this hash was made
+        await users.set_password_hash(user.id, new_hash)
+        user.hashed_password = new_hash
+        invalidate_cached_user(user.email)
     return user
 
+def invalidate_cached_user(email: str):
+    """
+    Drop every cached principal for a user. Call after a password change,
+    deactivation or any other update that must take effect immediately.
+    """
+    for token, user in _principal_cache.items():
+        if user.email == email:
+            _principal_cache.pop(token)
+
+def clear_principal_cache():
+    _principal_cache.clear()
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Database = Depends(get_database)
+    users: UserRepository = Depends(get_users)
 ) -> User:
     """Get current authenticated user"""
     credentials_exception = HTTPException(
@@ -67,8 +169,14 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    token = credentials.credentials
+    user = _principal_cache.get(token)
+    if user is not None:
+        return user
+
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        with timed("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
@@ -76,9 +184,16 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_email(db, email=token_data.email)
+    with timed("user_lookup"):
+        user = await users.find_by_email(token_data.email)
     if user is None:
         raise credentials_exception
+    # Never serve a cached principal past the token's own expiry
+    ttl = AUTH_USER_CACHE_TTL_SECONDS
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        _principal_cache.set(token, user, ttl=ttl)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -0,0 +1,65 @@
+"""
+Just enough of pymongo's async API over mongomock for the repositories, so
+load_test.py can run the app without a MongoDB server. Every call completes
+synchronously, so latencies measured this way exclude database round trips.
+"""
+import mongomock
+
+
+class AsyncMockCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit: int):
+        self._cursor = self._cursor.limit(limit)
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        documents = list(self._cursor)
+        return documents if length is None else documents[:length]
+
+
+class AsyncMockCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs) -> AsyncMockCursor:
+        return AsyncMockCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+class AsyncMockDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name: str) -> AsyncMockCollection:
+        return AsyncMockCollection(self._database[name])
+
+    __getattr__ = __getitem__
+
+
+def create_database(name: str) -> AsyncMockDatabase:
+    return AsyncMockDatabase(mongomock.MongoClient()[name])
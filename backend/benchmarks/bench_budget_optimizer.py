@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for budget_optimizer.fit_to_budget.
+
+Builds rule-based itineraries of increasing length, scales their costs so
+they overshoot the budget by --overshoot, and times the fit.
+
+Usage (from backend/):
+    python benchmarks/bench_budget_optimizer.py [--days 5 15 30 60] [--overshoot 1.5] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from budget_optimizer import fit_to_budget  # noqa: E402
+from itinerary_service import days_to_items, index_days  # noqa: E402
+from llm_backends import build_rule_based_days  # noqa: E402
+from models import ItineraryRequest  # noqa: E402
+
+
+def build_items(num_days: int, overshoot: float) -> tuple:
+    """Rule-based items for a num_days trip costing overshoot times its budget"""
+    request = ItineraryRequest(
+        destination="Lisbon", start_date="", end_date="", budget=300.0 * num_days, currency="EUR",
+        travelers=2, preferences=["food", "museums", "nature"]
+    )
+    days = json.loads(json.dumps(build_rule_based_days(request, num_days)))
+    items = days_to_items(index_days(days, num_days), request)
+    total = sum(item.cost for item in items) * request.travelers
+    for position, item in enumerate(items):
+        # Uneven costs so the selection is not trivial
+        item.cost = round(item.cost * overshoot * request.budget / total * (0.5 + (position * 37 % 100) / 100), 2)
+    return items, request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, nargs="+", default=[5, 15, 30, 60])
+    parser.add_argument("--overshoot", type=float, default=1.5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'days':>6}{'items':>8}{'median ms':>12}{'kept':>8}{'cost':>12}{'budget':>12}{'feasible':>10}")
+    for num_days in args.days:
+        items, request = build_items(num_days, args.overshoot)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            kept, report = fit_to_budget(items, request.budget, request.travelers)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(
+            f"{num_days:>6}{len(items):>8}{statistics.median(timings):>12.2f}{len(kept):>8}"
+            f"{report.total_cost:>12.2f}{report.budget:>12.2f}{str(report.feasible):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
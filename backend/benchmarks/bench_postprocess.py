@@ -0,0 +1,161 @@
+"""
+Micro-benchmark for turning the model's day/expenses payload into ItineraryItems.
+
+Compares the original per-item loop (linear keyword scan + one pydantic model
+per item) with the paths the service takes today: parse_itinerary_payload +
+days_to_items for a whole completion (compiled classifier + one TypeAdapter
+validation for the whole list), and IncrementalArrayParser + day_to_items for
+a streamed one.
+
+Usage (from backend/):
+    python benchmarks/bench_postprocess.py [--items 2000] [--chunk 64] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from category_classifier import classify_item  # noqa: E402
+from itinerary_service import (  # noqa: E402
+    FOOD_KEYWORDS, ITINERARY_ITEMS_ADAPTER, day_to_item_dicts, day_to_items, days_to_items, index_days,
+    parse_itinerary_payload
+)
+from json_stream import IncrementalArrayParser  # noqa: E402
+from models import ItineraryItem, ItineraryRequest  # noqa: E402
+
+SAMPLE_ACTIVITIES = [
+    ("food", "Lunch at Bistro", "French cuisine"),
+    ("activities", "Louvre Visit", "Art museum"),
+    ("transportation", "Metro Ticket", "Subway ride"),
+    ("accommodation", "Hotel check-in", "Boutique hotel near the river"),
+    ("shopping", "Buy souvenirs", "Local market stalls"),
+    ("entertainment", "Concert ticket", "Evening jazz show"),
+    ("sightseeing", "Old town walk", "Guided walking tour"),
+    ("food", "Wine tasting", "Regional wines"),
+]
+
+
+def build_payload(num_items: int) -> str:
+    """A JSON day/expenses payload with at least num_items activities"""
+    per_day = len(SAMPLE_ACTIVITIES)
+    days = []
+    for day in range(1, num_items // per_day + 2):
+        expenses = {}
+        for index, (category, name, description) in enumerate(SAMPLE_ACTIVITIES):
+            expenses.setdefault(category, []).append({
+                "name": f"{name} {day}", "description": description,
+                "cost": 10.0 + index, "time": f"{8 + index:02d}:00", "category": category,
+            })
+        days.append({"day": day, "expenses": expenses})
+    return json.dumps(days)
+
+
+def legacy_parse(content: str, request: ItineraryRequest):
+    """The pre-optimisation parsing loop, kept verbatim for comparison"""
+    def is_food_item(title, description):
+        text = f"{title} {description}".lower()
+        return any(word in text for word in FOOD_KEYWORDS)
+
+    itinerary_data = json.loads(content)
+    itinerary_items = []
+    item_id = 1
+    for day_obj in itinerary_data:
+        day_num = day_obj.get("day", "")
+        for category, activities in day_obj.get("expenses", {}).items():
+            for activity in activities:
+                title = activity.get("name", "")
+                description = activity.get("description", "")
+                cost = float(activity.get("cost", 0.0))
+                time_ = activity.get("time", "")
+                activity_category = activity.get("category", category)
+                if is_food_item(title, description):
+                    activity_category = "food"
+                itinerary_items.append(ItineraryItem(
+                    id=str(item_id), day=day_num, time=time_, title=title,
+                    description=description, location=request.destination,
+                    type=activity_category, duration="", cost=cost, rating=4.5,
+                    completed=False
+                ))
+                item_id += 1
+    return itinerary_items
+
+
+def current_parse(content: str, request: ItineraryRequest, num_days: int):
+    """What request_itinerary_days and request_itinerary_completion do with a completion"""
+    days, _ = parse_itinerary_payload(content)
+    return days_to_items(index_days(days, num_days), request)
+
+
+def streamed_parse(chunks: list, request: ItineraryRequest, num_days: int):
+    """What _stream_itinerary_items does with the deltas of a streamed completion"""
+    parser = IncrementalArrayParser()
+    items = []
+    for chunk in chunks:
+        for day_obj in index_days(parser.feed(chunk), num_days).values():
+            items.extend(day_to_items(day_obj, request, len(items) + 1))
+    return items
+
+
+def bench(func, repeat: int) -> float:
+    """Median wall time of func() in milliseconds"""
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--chunk", type=int, default=64, help="characters per streamed delta")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    request = ItineraryRequest(
+        destination="Paris", start_date="2025-06-01", end_date="2025-06-03",
+        budget=1500, currency="EUR", travelers=2, preferences=["food", "museums"],
+    )
+    content = build_payload(args.items)
+    num_days = len(json.loads(content))
+    chunks = [content[start:start + args.chunk] for start in range(0, len(content), args.chunk)]
+    item_count = len(current_parse(content, request, num_days))
+    assert len(streamed_parse(chunks, request, num_days)) == item_count
+
+    item_dicts = []
+    for day_obj in json.loads(content):
+        item_dicts.extend(day_to_item_dicts(day_obj, request, len(item_dicts) + 1))
+    texts = [(item["title"], item["description"], item["type"]) for item in item_dicts]
+
+    def legacy_classify():
+        categories = []
+        for title, description, category in texts:
+            text = f"{title} {description}".lower()
+            categories.append("food" if any(word in text for word in FOOD_KEYWORDS) else category)
+        return categories
+
+    rows = [
+        ("classification", bench(legacy_classify, args.repeat),
+         bench(lambda: [classify_item(*text) for text in texts], args.repeat)),
+        ("model construction", bench(lambda: [ItineraryItem(**item) for item in item_dicts], args.repeat),
+         bench(lambda: ITINERARY_ITEMS_ADAPTER.validate_python(item_dicts), args.repeat)),
+    ]
+    legacy_ms = bench(lambda: legacy_parse(content, request), args.repeat)
+    rows += [
+        ("end to end", legacy_ms, bench(lambda: current_parse(content, request, num_days), args.repeat)),
+        ("end to end streamed", legacy_ms, bench(lambda: streamed_parse(chunks, request, num_days), args.repeat)),
+    ]
+    print(f"{item_count} items, median of {args.repeat} runs")
+    print(f"{'stage':<20}{'legacy ms':>12}{'current ms':>12}{'speedup':>10}")
+    for stage, legacy_ms, current_ms in rows:
+        print(f"{stage:<20}{legacy_ms:>12.2f}{current_ms:>12.2f}{legacy_ms / current_ms:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for rendering a GET /trips page.
+
+Compares the original path (stringify ObjectIds, jsonable_encoder, then
+json.dumps) with the orjson path FastJSONResponse takes on the raw
+documents, for both the summary and the full view.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--trips 500] [--items 30] [--repeat 20]
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from responses import dumps  # noqa: E402
+
+
+def build_trips(num_trips: int, num_items: int, full: bool) -> list:
+    """Trip documents shaped like the ones find() returns"""
+    user_id = ObjectId()
+    trips = []
+    for index in range(num_trips):
+        trip = {
+            "_id": ObjectId(), "user_id": user_id, "destination": "Paris",
+            "start_date": "2025-06-01", "end_date": "2025-06-05", "budget": 1500.0 + index,
+            "currency": "EUR", "travelers": 2, "preferences": ["food", "museums"],
+            "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(), "version": 3,
+        }
+        if full:
+            trip["itinerary"] = [{
+                "id": str(item), "day": 1 + item // 6, "time": "09:00", "title": f"Activity {item}",
+                "description": "Guided visit", "location": "Paris", "type": "activities",
+                "duration": "2 hours", "cost": 25.0, "rating": 4.5, "completed": False,
+            } for item in range(num_items)]
+            trip["flights"] = []
+            trip["expenses"] = []
+        trips.append(trip)
+    return trips
+
+
+def legacy_render(trips: list) -> bytes:
+    """The pre-optimisation response path, kept for comparison"""
+    rendered = []
+    for trip in trips:
+        trip["id"] = str(trip.pop("_id"))
+        trip["user_id"] = str(trip["user_id"])
+        rendered.append(trip)
+    return json.dumps(jsonable_encoder(rendered)).encode("utf-8")
+
+
+def current_render(trips: list) -> bytes:
+    rendered = []
+    for trip in trips:
+        trip["id"] = trip.pop("_id")
+        rendered.append(trip)
+    return dumps(rendered)
+
+
+def bench(func, trips: list, repeat: int) -> float:
+    """Median wall time of func(copy of trips) in milliseconds, excluding the copy"""
+    func(copy.deepcopy(trips))  # warm up
+    timings = []
+    for _ in range(repeat):
+        documents = copy.deepcopy(trips)
+        start = time.perf_counter()
+        func(documents)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=500)
+    parser.add_argument("--items", type=int, default=30, help="itinerary items per trip in the full view")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.trips} trips, median of {args.repeat} runs")
+    print(f"{'view':<20}{'legacy ms':>12}{'current ms':>12}{'speedup':>10}")
+    for view, full in (("summary", False), ("full", True)):
+        trips = build_trips(args.trips, args.items, full)
+        legacy_ms = bench(legacy_render, trips, args.repeat)
+        current_ms = bench(current_render, trips, args.repeat)
+        print(f"{view:<20}{legacy_ms:>12.2f}{current_ms:>12.2f}{legacy_ms / current_ms:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Load test for the API: drives signup, login, /auth/me, the /trips endpoints
+and /itinerary/generate, and reports requests per second and p50/p95/p99
+latency per endpoint.
+
+By default the app runs in-process behind an ASGI transport with mongomock
+as the database and the replay LLM backend, so no network access or API
+spend is involved. Pass --mongo-url to use a real MongoDB (data goes to the
+--database database), or --url to drive an already running server instead.
+
+Usage (from backend/):
+    python benchmarks/load_test.py [--requests 200] [--concurrency 20]
+    python benchmarks/load_test.py --save benchmarks/baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/baseline.json [--threshold 0.2]
+
+Exits with status 1 when an endpoint's p95 latency rose, or its throughput
+fell, by more than --threshold relative to the baseline. BCRYPT_ROUNDS and
+the other settings are read from the environment as usual.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DESTINATIONS = ["Paris", "Rome", "Lisbon", "Tokyo", "Kyoto", "Barcelona", "Prague", "Vienna", "Istanbul", "Mexico City"]
+PREFERENCES = [["museums", "food"], ["hiking", "nature"], ["shopping"], ["nightlife", "food"], []]
+PASSWORD = "load-test-password"
+
+
+class EndpointStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+        self.wall_seconds = 0.0
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+        count = len(latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(count - 1, int(round(p / 100 * (count - 1))))]
+
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "rps": count / self.wall_seconds if self.wall_seconds else 0.0,
+            "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "p99_ms": percentile(99),
+        }
+
+
+async def run_phase(
+    name: str, count: int, concurrency: int,
+    send: Callable[[int], Awaitable[httpx.Response]], results: Dict[str, dict]
+) -> List[httpx.Response]:
+    """Send count requests with at most concurrency in flight and record their latencies"""
+    stats = EndpointStats(name)
+    responses: List[httpx.Response] = [None] * count
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < count:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await send(index)
+            except Exception as e:
+                stats.errors += 1
+                print(f"  {name} #{index} failed: {e}", file=sys.stderr)
+                continue
+            stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                stats.errors += 1
+            responses[index] = response
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+    stats.wall_seconds = time.perf_counter() - start
+    results[name] = stats.summary()
+    return responses
+
+
+def json_or_empty(response: httpx.Response):
+    if response is None or response.status_code >= 400:
+        return {}
+    return response.json()
+
+
+async def run_scenario(client: httpx.AsyncClient, count: int, concurrency: int) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    run_id = uuid.uuid4().hex[:8]
+    emails = [f"load-{run_id}-{index}@example.com" for index in range(count)]
+
+    await run_phase("POST /auth/signup", count, concurrency, lambda i: client.post(
+        "/auth/signup", json={"email": emails[i], "password": PASSWORD, "full_name": f"Load Test {i}"}
+    ), results)
+
+    logins = await run_phase("POST /auth/login", count, concurrency, lambda i: client.post(
+        "/auth/login", json={"email": emails[i], "password": PASSWORD}
+    ), results)
+    headers = [
+        {"Authorization": f"Bearer {json_or_empty(response).get('access_token', '')}"}
+        for response in logins
+    ]
+
+    await run_phase("GET /auth/me", count, concurrency, lambda i: client.get(
+        "/auth/me", headers=headers[i]
+    ), results)
+
+    def trip(i: int) -> dict:
+        return {
+            "destination": DESTINATIONS[i % len(DESTINATIONS)],
+            "start_date": "2025-06-01", "end_date": "2025-06-04",
+            "budget": 1000 + 250 * (i % 8), "currency": "EUR", "travelers": 1 + i % 3,
+            "preferences": PREFERENCES[i % len(PREFERENCES)],
+        }
+
+    created = await run_phase("POST /trips", count, concurrency, lambda i: client.post(
+        "/trips", json=trip(i), headers=headers[i]
+    ), results)
+    trip_ids = [json_or_empty(response).get("id", "missing") for response in created]
+
+    await run_phase("GET /trips", count, concurrency, lambda i: client.get(
+        "/trips", params={"limit": 20, "view": "summary"}, headers=headers[i]
+    ), results)
+
+    await run_phase("PUT /trips/{id}", count, concurrency, lambda i: client.put(
+        f"/trips/{trip_ids[i]}", json={"budget": 1500 + i}, headers=headers[i]
+    ), results)
+
+    await run_phase("POST /trips/{id}/itinerary", count, concurrency, lambda i: client.post(
+        f"/trips/{trip_ids[i]}/itinerary", headers=headers[i], json={
+            "day": 1, "time": "09:00", "title": "Museum visit", "description": "Morning at the museum",
+            "location": DESTINATIONS[i % len(DESTINATIONS)], "type": "activities", "duration": "2 hours",
+            "cost": 20.0, "rating": 4.5,
+        }
+    ), results)
+
+    # Destinations, budgets and preferences repeat, so later requests also exercise cache hits
+    await run_phase("POST /itinerary/generate", count, concurrency, lambda i: client.post(
+        "/itinerary/generate", json={**trip(i), "budget": 1000 + 250 * (i % 4)}
+    ), results)
+    return results
+
+
+async def run_in_process(args) -> Dict[str, dict]:
+    os.environ["LLM_BACKEND"] = args.llm_backend
+    if args.llm_latency:
+        os.environ["LLM_REPLAY_LATENCY"] = args.llm_latency
+    os.environ["DATABASE_NAME"] = args.database
+    os.environ.setdefault("SECRET_KEY", "load-test-secret")
+    if args.mongo_url:
+        os.environ["MONGODB_URL"] = args.mongo_url
+
+    # Imported only now so the settings above are picked up at import time
+    import logging
+    from auth import shutdown_password_executor
+    from clients import close_clients, init_clients
+    from database import DATABASE_NAME, close_mongo_connection, connect_to_mongo, ensure_indexes, is_connected, use_database
+    from main import app
+    if not args.verbose:
+        # Keep the app's per-request log records out of the report
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.mongo_url:
+        await connect_to_mongo()
+        if not is_connected():
+            raise SystemExit("❌ MongoDB is not reachable")
+    else:
+        try:
+            from async_mongomock import create_database
+        except ImportError:
+            raise SystemExit("❌ mongomock is not installed; pip install mongomock or pass --mongo-url")
+        database = create_database(DATABASE_NAME)
+        await ensure_indexes(database)
+        use_database(database)
+    init_clients()
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            return await run_scenario(client, args.requests, args.concurrency)
+    finally:
+        await close_clients()
+        shutdown_password_executor()
+        await close_mongo_connection()
+
+
+async def run_remote(args) -> Dict[str, dict]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=120, verify=False) as client:
+        return await run_scenario(client, args.requests, args.concurrency)
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Describe every endpoint whose p95 or throughput regressed past threshold"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {previous['rps']:.1f} -> {current['rps']:.1f}")
+    return regressions
+
+
+def print_report(results: Dict[str, dict], args):
+    print(f"{args.requests} requests per endpoint, concurrency {args.concurrency}")
+    print(f"{'endpoint':<30}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in results.items():
+        print(
+            f"{name:<30}{stats['rps']:>9.1f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['errors']:>8}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of mongomock")
+    parser.add_argument("--database", default="travelgpt_loadtest")
+    parser.add_argument("--llm-backend", default="replay", choices=["replay", "rules", "openai"])
+    parser.add_argument("--llm-latency", help="LLM_REPLAY_LATENCY for the replay backend, e.g. fixed:800")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a JSON file written by --save")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="show the app's INFO log records")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    print_report(results, args)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "target": args.url or ("mongodb" if args.mongo_url else "mongomock"),
+                "llm_backend": args.llm_backend,
+                "endpoints": results,
+            }, f, indent=2)
+        print(f"💾 Saved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["endpoints"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ Regressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print(f"✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Deterministic budget fitting for generated itineraries.
+
+Model output often costs more than the traveler's budget. Rather than asking
+the model again, fit_to_budget() keeps the best subset of the items that fits
+the budget and each day's time window, always keeping completed items and
+the cheapest BUDGET_MIN_FOOD_PER_DAY meals of every day, and reports what it
+dropped and any constraint it could not meet.
+"""
+import math
+import os
+import re
+from collections import defaultdict
+from operator import gt
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from category_classifier import is_food_text
+from models import BudgetDayReport, BudgetFitReport, ItineraryItem
+
+load_dotenv()
+
+BUDGET_DAY_START = os.getenv("BUDGET_DAY_START", "08:00")
+BUDGET_DAY_END = os.getenv("BUDGET_DAY_END", "22:00")
+BUDGET_MIN_FOOD_PER_DAY = int(os.getenv("BUDGET_MIN_FOOD_PER_DAY", "1"))
+# Resolution of the knapsack: costs are rounded up to 1/BUDGET_OPTIMIZER_STEPS
+# of the spare budget, so the selection can waste that much but never overspends
+BUDGET_OPTIMIZER_STEPS = max(1, int(os.getenv("BUDGET_OPTIMIZER_STEPS", "250")))
+# Items on each side of the greedy cut that the knapsack reconsiders; the rest
+# keep their greedy decision, which keeps large itineraries in the milliseconds
+BUDGET_OPTIMIZER_CORE = max(1, int(os.getenv("BUDGET_OPTIMIZER_CORE", "20")))
+
+# Time an item takes when its duration is missing or unreadable
+DEFAULT_MINUTES = {"food": 60, "transportation": 15, "accommodation": 0}
+DEFAULT_ACTIVITY_MINUTES = 120
+
+CLOCK_PATTERN = re.compile(r"^\s*(\d{1,2}):(\d{2})")
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m)\b", re.IGNORECASE)
+
+
+def parse_clock(value: Optional[str]) -> Optional[int]:
+    """Minutes after midnight of an "HH:MM" time (up to 24:00), or None"""
+    match = CLOCK_PATTERN.match(value or "")
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if minutes > 59 or hours > 24 or (hours == 24 and minutes):
+        return None
+    return hours * 60 + minutes
+
+
+def resolve_window(day_start: Optional[str] = None, day_end: Optional[str] = None) -> Tuple[int, int]:
+    """
+    The daily window in minutes after midnight, from the given times or the
+    BUDGET_DAY_START/END defaults. Raises ValueError for unreadable times or
+    an empty window.
+    """
+    window = []
+    for value, default in ((day_start, BUDGET_DAY_START), (day_end, BUDGET_DAY_END)):
+        minutes = parse_clock(value or default)
+        if minutes is None:
+            raise ValueError(f"Invalid time of day: {value or default}")
+        window.append(minutes)
+    if window[1] <= window[0]:
+        raise ValueError("day_end must be later than day_start")
+    return window[0], window[1]
+
+
+def is_food(item: ItineraryItem) -> bool:
+    return item.type == "food" or is_food_text(f"{item.title} {item.description}".lower())
+
+
+def item_minutes(item: ItineraryItem) -> int:
+    """Minutes an item takes, from durations like "2 hours" or "1 hour 30 min" """
+    matches = DURATION_PATTERN.findall(item.duration or "")
+    if matches:
+        return round(sum(
+            float(amount) * (60 if unit[0].lower() == "h" else 1) for amount, unit in matches
+        ))
+    if is_food(item):
+        return DEFAULT_MINUTES["food"]
+    return DEFAULT_MINUTES.get(item.type, DEFAULT_ACTIVITY_MINUTES)
+
+
+def item_value(item: ItineraryItem) -> float:
+    # Every kept item counts, better-rated ones more
+    return max(item.rating, 0.1)
+
+
+def knapsack(weights: List[float], values: List[float], capacity: float) -> List[int]:
+    """Exact 0/1 knapsack over BUDGET_OPTIMIZER_STEPS steps of capacity; indexes in ascending order"""
+    if capacity <= 0:
+        return [index for index, weight in enumerate(weights) if weight <= 0]
+    size = BUDGET_OPTIMIZER_STEPS
+    step = capacity / size
+    # best[c]: highest value within c steps; each item's row records the
+    # capacities where taking it improved on the rows before it
+    best = [0.0] * (size + 1)
+    rows: List[Optional[Tuple[int, bytes]]] = []
+    for weight, value in zip(weights, values):
+        cells = max(0, math.ceil(weight / step - 1e-9))
+        if cells > size:
+            rows.append(None)
+            continue
+        with_item = [total + value for total in best[:size + 1 - cells]]
+        without_item = best[cells:]
+        rows.append((cells, bytes(map(gt, with_item, without_item))))
+        best = best[:cells] + list(map(max, without_item, with_item))
+
+    chosen = []
+    remaining = size
+    for index in range(len(weights) - 1, -1, -1):
+        row = rows[index]
+        if row is None:
+            continue
+        cells, improved = row
+        if remaining >= cells and improved[remaining - cells]:
+            chosen.append(index)
+            remaining -= cells
+    return chosen[::-1]
+
+
+def choose_items(weights: List[float], values: List[float], capacity: float) -> List[int]:
+    """
+    Indexes of the items with (near) the highest total value whose weights
+    fit in capacity, in ascending order.
+
+    Items are ranked by value per unit of weight. Those well before the point
+    where the ranking runs out of budget are taken, those well after it are
+    not, and the knapsack decides the BUDGET_OPTIMIZER_CORE items either side.
+    """
+    # Required items may already be over budget; free items still fit
+    capacity = max(capacity, 0.0)
+    if sum(weights) <= capacity:
+        return list(range(len(weights)))
+    ranked = sorted(
+        range(len(weights)),
+        key=lambda index: -values[index] / weights[index] if weights[index] > 0 else -math.inf
+    )
+    cut = 0
+    used = 0.0
+    while cut < len(ranked) and used + weights[ranked[cut]] <= capacity:
+        used += weights[ranked[cut]]
+        cut += 1
+    first = max(cut - BUDGET_OPTIMIZER_CORE, 0)
+    core = ranked[first:cut + BUDGET_OPTIMIZER_CORE]
+    taken = ranked[:first]
+    spare = capacity - sum(weights[index] for index in taken)
+    chosen = {core[position] for position in knapsack(
+        [weights[index] for index in core], [values[index] for index in core], spare
+    )}
+    # Rounding weights up to whole steps can leave room for items that fit exactly
+    spare -= sum(weights[index] for index in chosen)
+    for index in ranked[first:]:
+        if index not in chosen and weights[index] <= spare:
+            chosen.add(index)
+            spare -= weights[index]
+    return sorted(taken + list(chosen))
+
+
+def fit_to_budget(
+    items: List[ItineraryItem],
+    budget: float,
+    travelers: int = 1,
+    day_start: Optional[str] = None,
+    day_end: Optional[str] = None,
+    min_food_per_day: Optional[int] = None,
+) -> Tuple[List[ItineraryItem], BudgetFitReport]:
+    """
+    Drop items until the itinerary costs at most budget for the whole party
+    (item costs are per traveler) and every day's items fit between day_start
+    and day_end. Returns the kept items in their original order and a report;
+    the report is not feasible when completed items and required meals
+    already break a constraint, or a day has too few meals. Raises ValueError
+    for an invalid time window.
+    """
+    travelers = max(travelers, 1)
+    window_start, window_end = resolve_window(day_start, day_end)
+    min_food = BUDGET_MIN_FOOD_PER_DAY if min_food_per_day is None else min_food_per_day
+    available_minutes = window_end - window_start
+    food = [is_food(item) for item in items]
+    minutes = [item_minutes(item) for item in items]
+    costs = [max(item.cost, 0.0) * travelers for item in items]
+
+    issues = []
+    dropped = set()
+    required = set()
+    by_day: Dict[int, List[int]] = defaultdict(list)
+    for index, item in enumerate(items):
+        by_day[item.day].append(index)
+
+    for day, indexes in sorted(by_day.items()):
+        optional = []
+        for index in indexes:
+            start = parse_clock(items[index].time)
+            if items[index].completed:
+                required.add(index)
+            elif start is not None and (start < window_start or start + minutes[index] > window_end):
+                dropped.add(index)
+            else:
+                optional.append(index)
+
+        meals = sorted(
+            (index for index in indexes if index not in dropped and food[index]),
+            key=lambda index: (index not in required, costs[index])
+        )
+        if len(meals) < min_food:
+            issues.append(f"Day {day} has {len(meals)} food item(s) in its time window; {min_food} required")
+        required.update(meals[:min_food])
+        optional = [index for index in optional if index not in required]
+
+        # Shed the least valuable minutes first until the day fits its window
+        used = sum(minutes[index] for index in indexes if index in required or index in optional)
+        optional.sort(key=lambda index: (item_value(items[index]) / max(minutes[index], 1), -index))
+        while used > available_minutes and optional:
+            index = optional.pop(0)
+            dropped.add(index)
+            used -= minutes[index]
+        if used > available_minutes:
+            issues.append(
+                f"Day {day} needs {used} minutes of completed items and meals; {available_minutes} available"
+            )
+
+    required_cost = sum(costs[index] for index in required)
+    if required_cost > budget:
+        issues.append(
+            f"Completed items and required meals cost {required_cost:.2f}, over the budget of {budget:.2f}"
+        )
+    candidates = [index for index in range(len(items)) if index not in required and index not in dropped]
+    chosen = choose_items(
+        [costs[index] for index in candidates],
+        [item_value(items[index]) for index in candidates],
+        budget - required_cost
+    )
+    kept = required | {candidates[position] for position in chosen}
+    dropped = set(range(len(items))) - kept
+
+    days = []
+    for day, indexes in sorted(by_day.items()):
+        day_kept = [index for index in indexes if index in kept]
+        days.append(BudgetDayReport(
+            day=day,
+            cost=round(sum(costs[index] for index in day_kept), 2),
+            minutes=sum(minutes[index] for index in day_kept),
+            available_minutes=available_minutes,
+            food_items=sum(1 for index in day_kept if food[index]),
+        ))
+    report = BudgetFitReport(
+        feasible=not issues,
+        budget=budget,
+        original_cost=round(sum(costs), 2),
+        total_cost=round(sum(costs[index] for index in kept), 2),
+        dropped_ids=[items[index].id for index in sorted(dropped)],
+        issues=issues,
+        days=days,
+    )
+    return [item for index, item in enumerate(items) if index in kept], report
@@ -0,0 +1,53 @@
+import re
+from typing import Dict, List, Optional
+
+ITINERARY_CATEGORIES = (
+    "food", "activities", "transportation", "accommodation",
+    "shopping", "entertainment", "health", "other",
+)
+
+# Substring keywords per category. Food wins over anything the model declared;
+# the others only decide items whose declared category is not one of ours.
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    "food": ["lunch", "dinner", "breakfast", "brunch", "wine", "meal", "restaurant", "cafe", "food", "tasting", "snack", "coffee", "tea"],
+    "accommodation": ["hotel", "hostel", "check-in", "check in", "airbnb", "resort", "guesthouse", "lodging"],
+    "transportation": ["metro", "subway", "train", "bus ", "taxi", "flight", "airport", "ferry", "transfer", "tram", "car rental"],
+    "shopping": ["shopping", "souvenir", "market", "boutique", "mall"],
+    "entertainment": ["concert", "theater", "theatre", "nightlife", "cinema", "opera", "festival", "show"],
+    "health": ["pharmacy", "spa", "massage", "clinic", "hospital", "wellness"],
+    "activities": ["tour", "museum", "visit", "hike", "gallery", "cathedral", "temple", "beach", "park", "walk"],
+}
+
+
+def _alternation(keywords: List[str]) -> str:
+    # Longest first so overlapping keywords report the most specific match
+    return "|".join(re.escape(word) for word in sorted(keywords, key=len, reverse=True))
+
+
+FOOD_PATTERN = re.compile(_alternation(CATEGORY_KEYWORDS["food"]))
+CATEGORY_PATTERN = re.compile("|".join(
+    f"(?P<{category}>{_alternation(keywords)})"
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    if category != "food"
+))
+
+
+def is_food_text(text: str) -> bool:
+    """True if lowercased text mentions any food keyword"""
+    return FOOD_PATTERN.search(text) is not None
+
+
+def classify_item(title: str, description: str, declared: Optional[str] = None) -> str:
+    """
+    Pick the itinerary category for an activity in a single regex pass.
+
+    Food keywords always win, a declared category that is one of ours is kept,
+    and anything else is classified by its first keyword match or "other".
+    """
+    text = f"{title} {description}".lower()
+    if FOOD_PATTERN.search(text):
+        return "food"
+    if declared in ITINERARY_CATEGORIES:
+        return declared
+    match = CATEGORY_PATTERN.search(text)
+    return match.lastgroup if match else "other"
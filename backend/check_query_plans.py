@@ -0,0 +1,114 @@
+"""
+Explain every query shape the API issues and fail if any of them scans a
+whole collection.
+
+Usage:
+    python check_query_plans.py
+
+Uses MONGODB_URL / DATABASE_NAME like the API. Indexes are created first,
+so this also verifies that the startup index bootstrap covers every query.
+"""
+import asyncio
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from database import connect_to_mongo, close_mongo_connection, is_connected, store
+from jobs import ITINERARY_JOB_MAX_ATTEMPTS, ITINERARY_JOBS_COLLECTION, ensure_job_indexes
+
+
+def query_shapes(database):
+    """
+    (description, cursor, expected indexes) mirroring the queries in
+    repositories.py and jobs.py. When expected indexes are given, the plan
+    must scan one of them.
+    """
+    user_id = ObjectId()
+    jobs = database[ITINERARY_JOBS_COLLECTION]
+    return [
+        ("users by email (signup, login, auth)",
+         database.users.find({"email": "plan-check@example.com"}).limit(1), None),
+        ("trips by user (GET /trips)",
+         database.trips.find({"user_id": user_id}).sort("_id", -1), ("user_id__id",)),
+        ("trips page after cursor (GET /trips?cursor=)",
+         database.trips.find({"user_id": user_id, "_id": {"$lt": ObjectId()}}).sort("_id", -1).limit(21),
+         ("user_id__id",)),
+        ("trip by id and owner (PUT /trips/{trip_id})",
+         database.trips.find({"_id": ObjectId(), "user_id": user_id}).limit(1), None),
+        ("job by fingerprint (POST /itinerary/jobs)",
+         jobs.find({"fingerprint": "plan-check"}).limit(1), ("fingerprint_unique",)),
+        ("oldest queued job (job claim)",
+         jobs.find({"status": "queued"}).sort("created_at", ASCENDING).limit(1), ("status_created_at",)),
+        ("expired lease (job reclaim)",
+         jobs.find({
+             "status": "running", "lease_expires_at": {"$lt": datetime.utcnow()},
+             "attempts": {"$lt": ITINERARY_JOB_MAX_ATTEMPTS},
+         }).sort("created_at", ASCENDING).limit(1),
+         ("status_lease_expires_at", "status_created_at")),
+    ]
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain plan tree"""
+    yield from (stage["stage"] for stage in plan_stage_docs(plan))
+
+
+def plan_stage_docs(plan):
+    """Yield every stage document in an explain plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from plan_stage_docs(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stage_docs(value)
+
+
+def scanned_indexes(plan) -> set:
+    """Names of the indexes an explain plan scans"""
+    return {
+        stage["indexName"] for stage in plan_stage_docs(plan)
+        if "IXSCAN" in stage["stage"] and "indexName" in stage
+    }
+
+
+async def check_plans() -> int:
+    await connect_to_mongo()
+    if not is_connected():
+        print("❌ MongoDB is not reachable")
+        return 2
+
+    failures = 0
+    try:
+        # The jobs collection's indexes are created with the job runners, not with the core indexes
+        await ensure_job_indexes(store.database)
+        for description, cursor, expected_indexes in query_shapes(store.database):
+            winning_plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+            stages = list(plan_stages(winning_plan))
+            indexes = scanned_indexes(winning_plan)
+            if "COLLSCAN" in stages:
+                failures += 1
+                print(f"❌ {description}: COLLSCAN ({' <- '.join(stages)})")
+            elif expected_indexes and not indexes & set(expected_indexes):
+                failures += 1
+                print(
+                    f"❌ {description}: expected IXSCAN on {' or '.join(expected_indexes)},"
+                    f" got {' <- '.join(stages)} {sorted(indexes)}"
+                )
+            else:
+                print(f"✅ {description}: {' <- '.join(stages)} {sorted(indexes)}")
+    finally:
+        await close_mongo_connection()
+
+    return 1 if failures else 0
+
+
+def main() -> int:
+    return asyncio.run(check_plans())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
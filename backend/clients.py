@@ -0,0 +1,91 @@
+import logging
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single completion may take before we give up and fall back
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+# Keep-alive connection pool to the LLM API, shared by every request in the worker
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+
+class ClientRegistry:
+    http_client: Optional[httpx.AsyncClient] = None
+    openai: Optional[AsyncOpenAI] = None
+
+
+registry = ClientRegistry()
+
+
+def init_clients():
+    """Create the process-wide API clients; called from the app lifespan"""
+    if registry.http_client is not None:
+        return
+    registry.http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0),
+    )
+    if os.getenv("OPENAI_API_KEY"):
+        registry.openai = _create_openai_client()
+    else:
+        logger.warning("OPENAI_API_KEY is not set; itinerary generation will use the fallback")
+
+
+def _create_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=registry.http_client,
+        max_retries=1
+    )
+
+
+async def close_clients():
+    """Close the API clients and their connection pools"""
+    if registry.http_client is not None:
+        await registry.http_client.aclose()
+    registry.openai = None
+    registry.http_client = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the shared async OpenAI client, creating it on first use"""
+    if registry.http_client is None:
+        init_clients()
+    if registry.openai is None:
+        # Raises OpenAIError when no API key is configured
+        registry.openai = _create_openai_client()
+    return registry.openai
+
+
+def get_http_pool_stats() -> dict:
+    """Connection counts for the LLM API keep-alive pool"""
+    stats = {
+        "max_connections": LLM_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": LLM_HTTP_MAX_KEEPALIVE,
+        "open_connections": 0,
+        "idle_connections": 0,
+        "queued_requests": 0,
+    }
+    transport = getattr(registry.http_client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    if pool is not None:
+        connections = pool.connections
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+        stats["queued_requests"] = sum(
+            1 for req in getattr(pool, "_requests", []) if getattr(req, "connection", None) is None
+        )
+    return stats
@@ -1,48 +1,172 @@
-from pymongo import MongoClient
-from pymongo.database import Database
+from pymongo import AsyncMongoClient, ASCENDING, DESCENDING, IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import monitoring
+from fastapi import HTTPException, status
+import logging
 import os
 from dotenv import load_dotenv
 from typing import Optional
 
+from metrics import METRICS_ENABLED, CommandTimingListener
+from repositories import TripRepository, UserRepository
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "travel_planner")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# How long a request waits for a free pooled connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running counters of MongoDB connection pool activity"""
+
+    def __init__(self):
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open_connections += 1
+
+    def connection_closed(self, event):
+        self.open_connections -= 1
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
 
-class MongoDB:
-    client: Optional[MongoClient] = None
-    database: Optional[Database] = None
-    connected: bool = False
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        self.checkouts += 1
 
-db = MongoDB()
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
 
-def connect_to_mongo():
-    """Create database connection"""
+pool_stats = PoolStatsListener()
+
+class DataStore:
+    """This worker's MongoDB client and the repositories built on it"""
+    client: Optional[AsyncMongoClient] = None
+    database: Optional[AsyncDatabase] = None
+    users: Optional[UserRepository] = None
+    trips: Optional[TripRepository] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.database is not None
+
+store = DataStore()
+
+def use_database(database: Optional[AsyncDatabase], client: Optional[AsyncMongoClient] = None):
+    """Point the repositories at database (None to disconnect)"""
+    store.client = client
+    store.database = database
+    store.users = UserRepository(database["users"]) if database is not None else None
+    store.trips = TripRepository(database["trips"]) if database is not None else None
+
+async def connect_to_mongo():
+    """Create this process's database connection pool"""
+    client = AsyncMongoClient(
+        MONGODB_URL,
+        serverSelectionTimeoutMS=5000,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[pool_stats, CommandTimingListener()] if METRICS_ENABLED else [pool_stats]
+    )
     try:
-        db.client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
         # Test the connection
-        db.client.admin.command('ping')
-        db.database = db.client[DATABASE_NAME]
-        db.connected = True
-        print(f"✅ Connected to MongoDB at {MONGODB_URL}")
+        await client.admin.command('ping')
+    except Exception as e:
+        logger.warning("MongoDB connection failed: %s; running in development mode without database", e)
+        await client.close()
+        return
+    use_database(client[DATABASE_NAME], client)
+    logger.info("Connected to MongoDB at %s", MONGODB_URL)
+    try:
+        await ensure_indexes(store.database)
     except Exception as e:
-        print(f"⚠️  MongoDB connection failed: {e}")
-        print("🔧 Running in development mode without database")
-        db.connected = False
+        logger.warning("Index creation failed: %s", e)
+
+# Indexes backing every query shape the API issues; see check_query_plans.py
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "trips": [
+        # Trip listing pages newest first by _id rather than created_at: _id is
+        # unique and increases with creation time, so it is its own cursor
+        IndexModel([("user_id", ASCENDING), ("_id", DESCENDING)], name="user_id__id"),
+    ],
+}
+
+async def ensure_indexes(database: AsyncDatabase):
+    """Create the application's indexes; a no-op for indexes that already exist"""
+    for collection, indexes in INDEXES.items():
+        await database[collection].create_indexes(indexes)
 
-def close_mongo_connection():
+async def close_mongo_connection():
     """Close database connection"""
-    if db.client and db.connected:
-        db.client.close()
-        db.connected = False
-        print("Disconnected from MongoDB")
+    client = store.client
+    use_database(None)
+    if client is not None:
+        await client.close()
+        logger.info("Disconnected from MongoDB")
 
-def get_database() -> Optional[Database]:
-    """Get database instance"""
-    if not db.connected:
-        raise Exception("MongoDB not connected. Please check your connection string.")
-    return db.database
+def require_connection():
+    if not store.connected:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database not available. Please check MongoDB connection."
+        )
+
+def get_users() -> UserRepository:
+    """FastAPI dependency for the users repository"""
+    require_connection()
+    return store.users
+
+def get_trips() -> TripRepository:
+    """FastAPI dependency for the trips repository"""
+    require_connection()
+    return store.trips
 
 def is_connected() -> bool:
     """Check if MongoDB is connected"""
-    return db.connected
\ No newline at end of file
+    return store.connected
+
+def get_pool_stats() -> dict:
+    """MongoDB connection pool configuration and live counters"""
+    return {
+        "connected": store.connected,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "open_connections": pool_stats.open_connections,
+        "checked_out": pool_stats.checked_out,
+        "checkouts": pool_stats.checkouts,
+        "checkout_failures": pool_stats.checkout_failures,
+    }
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from pymongo.asynchronous.database import AsyncDatabase
+
+from database import is_connected, store
+from models import ItineraryItem, ItineraryRequest
+from ttl_cache import TTLCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ITINERARY_CACHE_MAX_ENTRIES = int(os.getenv("ITINERARY_CACHE_MAX_ENTRIES", "1024"))
+ITINERARY_CACHE_TTL_SECONDS = int(os.getenv("ITINERARY_CACHE_TTL_SECONDS", "86400"))
+# Budgets within the same geometric bucket (10% wide by default) share a cache entry
+ITINERARY_CACHE_BUDGET_STEP = float(os.getenv("ITINERARY_CACHE_BUDGET_STEP", "0.1"))
+ITINERARY_CACHE_MONGO = os.getenv("ITINERARY_CACHE_MONGO", "false").lower() == "true"
+ITINERARY_CACHE_MONGO_TTL_SECONDS = int(os.getenv("ITINERARY_CACHE_MONGO_TTL_SECONDS", "604800"))
+ITINERARY_CACHE_COLLECTION = "itinerary_cache"
+
+SEASONS = {
+    12: "winter", 1: "winter", 2: "winter",
+    3: "spring", 4: "spring", 5: "spring",
+    6: "summer", 7: "summer", 8: "summer",
+    9: "autumn", 10: "autumn", 11: "autumn",
+}
+
+
+class CacheStats:
+    memory_hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+
+stats = CacheStats()
+_memory = TTLCache(ITINERARY_CACHE_MAX_ENTRIES, ITINERARY_CACHE_TTL_SECONDS)
+
+
+def budget_bucket(budget: float) -> int:
+    """Map a budget onto a geometric bucket index"""
+    return int(math.floor(math.log(max(budget, 1.0)) / math.log1p(ITINERARY_CACHE_BUDGET_STEP)))
+
+
+def trip_season(start_date: Optional[str]) -> Optional[str]:
+    """Return the season a YYYY-MM-DD start date falls in, if parseable"""
+    try:
+        return SEASONS[datetime.strptime(start_date, "%Y-%m-%d").month]
+    except (TypeError, ValueError):
+        return None
+
+
+def build_cache_key(request: ItineraryRequest, num_days: int, backend: str = "openai") -> str:
+    """
+    Build a content-addressed key for a validated request.
+
+    Requests that only differ in destination casing/whitespace, preference order,
+    a small budget difference or the exact dates of a same-length trip in the same
+    season map to the same key. Output from different LLM backends is never shared.
+    """
+    canonical = {
+        "destination": " ".join(request.destination.split()).casefold(),
+        "preferences": sorted({p.strip().casefold() for p in request.preferences if p.strip()}),
+        "budget": budget_bucket(request.budget),
+        "currency": request.currency.strip().upper(),
+        "travelers": request.travelers,
+        "days": num_days,
+        "season": trip_season(request.start_date),
+        "backend": backend,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _persistent_enabled() -> bool:
+    return ITINERARY_CACHE_MONGO and is_connected()
+
+
+async def ensure_cache_indexes(database: AsyncDatabase):
+    """Create the TTL index that expires persisted cache entries"""
+    await database[ITINERARY_CACHE_COLLECTION].create_index(
+        "created_at", expireAfterSeconds=ITINERARY_CACHE_MONGO_TTL_SECONDS
+    )
+
+
+async def _load_persistent(key: str) -> Optional[List[dict]]:
+    doc = await store.database[ITINERARY_CACHE_COLLECTION].find_one({"_id": key}, {"items": 1})
+    return doc["items"] if doc else None
+
+
+async def _store_persistent(key: str, items: List[dict]):
+    await store.database[ITINERARY_CACHE_COLLECTION].replace_one(
+        {"_id": key},
+        {"_id": key, "items": items, "created_at": datetime.utcnow()},
+        upsert=True
+    )
+
+
+async def get_cached_itinerary(key: str) -> Optional[List[ItineraryItem]]:
+    """Look key up in memory, then in MongoDB; returns fresh copies of the items"""
+    items = _memory.get(key)
+    if items is not None:
+        stats.memory_hits += 1
+        return [item.model_copy() for item in items]
+    if _persistent_enabled():
+        try:
+            docs = await _load_persistent(key)
+        except Exception as e:
+            logger.warning("Itinerary cache read failed: %s", e)
+            docs = None
+        if docs is not None:
+            stats.persistent_hits += 1
+            items = [ItineraryItem(**doc) for doc in docs]
+            _memory.set(key, tuple(items))
+            return [item.model_copy() for item in items]
+    stats.misses += 1
+    return None
+
+
+async def store_cached_itinerary(key: str, items: List[ItineraryItem]):
+    """Store a freshly generated itinerary in every enabled tier"""
+    _memory.set(key, tuple(item.model_copy() for item in items))
+    stats.stores += 1
+    if _persistent_enabled():
+        try:
+            await _store_persistent(key, [item.model_dump() for item in items])
+        except Exception as e:
+            logger.warning("Itinerary cache write failed: %s", e)
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the itinerary cache"""
+    hits = stats.memory_hits + stats.persistent_hits
+    lookups = hits + stats.misses
+    return {
+        "memory_hits": stats.memory_hits,
+        "persistent_hits": stats.persistent_hits,
+        "misses": stats.misses,
+        "stores": stats.stores,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "memory_entries": len(_memory),
+        "persistent_enabled": _persistent_enabled(),
+    }
+
+
+def clear_memory_cache():
+    _memory.clear()
@@ -1,26 +1,126 @@
-from openai import OpenAI
+import asyncio
 import os
 import json
-from typing import List
-from models import ItineraryItem, ItineraryRequest
-import os
+import logging
+import re
+from contextlib import aclosing, asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from models import ItineraryItem, ItineraryRequest, ItineraryBatchResult, ItineraryPlan
+from clients import LLM_TIMEOUT_SECONDS
+from llm_backends import Completion, LLMBackend, get_backend
+from budget_optimizer import fit_to_budget
+from itinerary_cache import build_cache_key, get_cached_itinerary, store_cached_itinerary
+from json_stream import IncrementalArrayParser
+from prompts import (
+    build_chunk_prompt, build_messages, build_regenerate_prompt, build_repair_prompt, build_user_prompt,
+    count_message_tokens, record_token_usage
+)
+from category_classifier import CATEGORY_KEYWORDS, classify_item, is_food_text
+from metrics import timed
 from fastapi import HTTPException
+from pydantic import TypeAdapter
+from bson import ObjectId
 
 from dotenv import load_dotenv
 load_dotenv()
 
-FOOD_KEYWORDS = ["lunch", "dinner", "breakfast", "brunch", "wine", "meal", "restaurant", "cafe", "food", "tasting", "snack", "coffee", "tea"]
+logger = logging.getLogger(__name__)
+
+# Upper bound on completions in flight per worker; extra requests wait for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+# Seconds a request may wait for a free slot before falling back
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+# On shutdown, how long to let in-flight generations finish before closing the clients
+LLM_DRAIN_TIMEOUT_SECONDS = float(os.getenv("LLM_DRAIN_TIMEOUT_SECONDS", "30"))
+# "text" (prompt-only), "json_object" or "json_schema"; json_schema needs a model
+# with structured outputs (gpt-4o-mini or newer), so the default stays "text"
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "text").lower()
+# Trips longer than this many days are generated as chunks in parallel; 0 disables chunking
+ITINERARY_CHUNK_THRESHOLD_DAYS = int(os.getenv("ITINERARY_CHUNK_THRESHOLD_DAYS", "5"))
+# Days per chunk, so a long trip takes about as long as a short one
+ITINERARY_CHUNK_DAYS = max(1, int(os.getenv("ITINERARY_CHUNK_DAYS", "3")))
+# Categories that recur every day; other activities are planned at most once per trip
+REPEATABLE_CATEGORIES = frozenset({"food", "transportation", "accommodation"})
+# Trim generated itineraries to the budget and daily time window (budget_optimizer) before returning them
+ITINERARY_FIT_BUDGET = os.getenv("ITINERARY_FIT_BUDGET", "false").lower() == "true"
+
+FOOD_KEYWORDS = CATEGORY_KEYWORDS["food"]
+
+# The opening and closing lines of a ```json fenced block; the closing one may be missing
+OPENING_FENCE_PATTERN = re.compile(r"^```[a-zA-Z]*\s*")
+CLOSING_FENCE_PATTERN = re.compile(r"\s*```$")
+
+# Validates a whole day's (or trip's) items in one call instead of one model at a time
+ITINERARY_ITEMS_ADAPTER = TypeAdapter(List[ItineraryItem])
+
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_in_flight: Dict[str, asyncio.Future] = {}
+T = TypeVar("T")
+
+
+class LLMSlotStats:
+    in_flight: int = 0
+    waiting: int = 0
+
+
+llm_slot_stats = LLMSlotStats()
+
+
+class SingleFlightStats:
+    coalesced: int = 0
+
+
+single_flight_stats = SingleFlightStats()
+
+@asynccontextmanager
+async def llm_slot():
+    """
+    Hold one of the LLM_MAX_CONCURRENCY completion slots, waiting at most
+    LLM_QUEUE_TIMEOUT_SECONDS for one to free up
+    """
+    llm_slot_stats.waiting += 1
+    try:
+        with timed("llm_queue_wait"):
+            await asyncio.wait_for(_llm_slots.acquire(), timeout=LLM_QUEUE_TIMEOUT_SECONDS)
+    finally:
+        llm_slot_stats.waiting -= 1
+    llm_slot_stats.in_flight += 1
+    try:
+        yield
+    finally:
+        llm_slot_stats.in_flight -= 1
+        _llm_slots.release()
+
+async def drain_llm_calls(timeout: float = LLM_DRAIN_TIMEOUT_SECONDS) -> int:
+    """
+    Wait up to timeout seconds for in-flight generations and completions to
+    finish; called on shutdown. Returns how many were still running.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while _in_flight or llm_slot_stats.in_flight or llm_slot_stats.waiting:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(0.1, remaining))
+    return len(_in_flight) + llm_slot_stats.in_flight
+
+def get_llm_slot_stats() -> dict:
+    return {
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "in_flight": llm_slot_stats.in_flight,
+        "waiting": llm_slot_stats.waiting,
+        "coalesced_requests": single_flight_stats.coalesced,
+    }
 
 def is_food_item(title, description):
-    text = f"{title} {description}".lower()
-    return any(word in text for word in FOOD_KEYWORDS)
+    return is_food_text(f"{title} {description}".lower())
 
-def generate_itinerary(request: ItineraryRequest) -> List[ItineraryItem]:
+def prepare_request(request: ItineraryRequest) -> Tuple[int, bool]:
     """
-    Generate a personalized itinerary using OpenAI GPT
+    Validate and normalize the request in place, returning (num_days, has_dates)
     """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    from datetime import datetime
     # Validate required fields
     if not request.destination or not request.destination.strip():
         raise HTTPException(status_code=400, detail="Destination is required.")
@@ -43,111 +143,594 @@ def generate_itinerary(request: ItineraryRequest) -> List[ItineraryItem]:
             num_days = (end_date - start_date).days + 1
         except Exception:
             has_dates = False
-    preferences_text = ", ".join(request.preferences) if request.preferences else "general travel"    # Compose a user-style prompt using frontend inputs
-    prompt = f"""Generate a {num_days}-day itinerary for me. You are my travel agent. My budget is {request.budget} {request.currency}. I am travelling to {request.destination} with {request.travelers} traveler(s)."""
-    if has_dates:
-        prompt += f" My trip is from {request.start_date} to {request.end_date}."
-    if preferences_text and preferences_text != "general travel":
-        prompt += f" My interests are: {preferences_text}."
-    # Add explicit instruction for structured daywise itinerary
-    prompt += (
-        "\nFor each activity/expense, use one of these categories: 'food', 'activities', 'transportation', 'accommodation', 'shopping', 'entertainment', 'health', 'other'."
-        "\nExamples:"
-        "\n- 'Lunch at Bistro' → category: 'food'"
-        "\n- 'Wine tasting tour' → category: 'food'"
-        "\n- 'Visit the Louvre' → category: 'activities'"
-        "\n- 'Metro ticket' → category: 'transportation'"
-        "\n- 'Hotel check-in' → category: 'accommodation'"
-        "\n- 'Buy souvenirs' → category: 'shopping'"
-        "\n- 'Concert ticket' → category: 'entertainment'"
-        "\n- 'Pharmacy purchase' → category: 'health'"
-        "\nIf unsure, use the closest matching category."
-        "\nPlease return the itinerary as a JSON array. Each element should be an object with: 'day' (integer), and 'expenses' (an object with keys as categories like 'food', 'activities', 'transportation', etc., and values as lists of activities/expenses for that category)."
-        "\nEach activity/expense should have: 'name', 'description', 'cost', 'time', and 'category'."
-        "\nExample:\n"
-        '[\n'
-        '  {"day": 1, "expenses": {\n'
-        '    "food": [\n'
-        '      {"name": "Lunch at Bistro", "description": "French cuisine", "cost": 25.0, "time": "12:00", "category": "food"}\n'
-        '    ],\n'
-        '    "activities": [\n'
-        '      {"name": "Louvre Visit", "description": "Art museum", "cost": 17.0, "time": "09:00", "category": "activities"}\n'
-        '    ],\n'
-        '    "transportation": [\n'
-        '      {"name": "Metro Ticket", "description": "Subway ride", "cost": 2.5, "time": "08:30", "category": "transportation"}\n'
-        '    ]\n'
-        '  }},\n'
-        '  {"day": 2, "expenses": {\n'
-        '    "food": [\n'
-        '      {"name": "Breakfast at Cafe", "description": "Coffee and croissant", "cost": 8.0, "time": "08:00", "category": "food"}\n'
-        '    ],\n'
-        '    "activities": [\n'
-        '      {"name": "Eiffel Tower", "description": "Landmark visit", "cost": 20.0, "time": "10:00", "category": "activities"}\n'
-        '    ]\n'
-        '  }}\n'
-        ']'
-    )
+    return num_days, has_dates
 
+def resolve_backend(request: ItineraryRequest) -> LLMBackend:
+    """
+    The LLM backend for a request: its "backend" override when allowed,
+    otherwise the deployment default
+    """
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert travel planner with deep knowledge of destinations worldwide. Generate detailed, personalized itineraries in JSON format only. Always consider budget constraints, traveler preferences, and realistic timing."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=2500
-        )
-        print("open ai response", response)
-        content = response.choices[0].message.content.strip()
+        return get_backend(request.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_response_format(mode: str) -> dict:
+    """
+    chat.completions.create options for the configured response format
+    """
+    if mode == "json_schema":
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "itinerary",
+                "strict": True,
+                "schema": ItineraryPlan.model_json_schema(),
+            },
+        }}
+    if mode == "json_object":
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+RESPONSE_FORMAT_OPTIONS = build_response_format(LLM_RESPONSE_FORMAT)
+# json_object and json_schema both need the {"days": [...]} wrapper
+OBJECT_RESPONSE = bool(RESPONSE_FORMAT_OPTIONS)
+
+def day_to_item_dicts(day_obj: dict, request: ItineraryRequest, first_id: int = 1) -> List[dict]:
+    """
+    Flatten one day object of the model's payload into itinerary item fields
+    """
+    day_num = day_obj.get("day", "")
+    location = request.destination
+    item_dicts = []
+    item_id = first_id
+    for category, activities in day_obj.get("expenses", {}).items():
+        for activity in activities:
+            title = activity.get("name", "")
+            description = activity.get("description", "")
+            item_dicts.append({
+                "id": str(item_id),
+                "day": day_num,
+                "time": activity.get("time", ""),
+                "title": title,
+                "description": description,
+                "location": location,
+                "type": classify_item(title, description, activity.get("category", category)),
+                "duration": "",
+                "cost": float(activity.get("cost", 0.0)),
+                "rating": 4.5,
+                "completed": False,
+            })
+            item_id += 1
+    return item_dicts
+
+def day_to_items(day_obj: dict, request: ItineraryRequest, first_id: int = 1) -> List[ItineraryItem]:
+    """
+    Convert one day object of the model's payload into itinerary items
+    """
+    with timed("model_construction"):
+        return ITINERARY_ITEMS_ADAPTER.validate_python(day_to_item_dicts(day_obj, request, first_id))
+
+def parse_itinerary_payload(content: str) -> Tuple[List[dict], bool]:
+    """
+    Extract the day objects from a completion, returning (days, complete).
+
+    A markdown fence around the JSON is stripped and a {"days": [...]} wrapper
+    is unwrapped. Output that is not valid JSON, usually because it was cut
+    off at max_tokens, is recovered up to its last complete day.
+    """
+    text = content.strip()
+    # Only strip the outer fence: the JSON may contain ``` inside a string
+    if text.startswith("```"):
+        text = CLOSING_FENCE_PATTERN.sub("", OPENING_FENCE_PATTERN.sub("", text, count=1), count=1)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        parser = IncrementalArrayParser()
+        days = [day_obj for day_obj in parser.feed(text) if isinstance(day_obj, dict)]
+        return days, parser.complete
+    if isinstance(data, dict):
+        data = data.get("days", [data] if "day" in data else [])
+    if not isinstance(data, list):
+        return [], False
+    return [day_obj for day_obj in data if isinstance(day_obj, dict)], True
+
+def index_days(days: List[dict], num_days: int) -> Dict[int, dict]:
+    """
+    Map day number -> day object, keeping the first object for each day in
+    1..num_days and dropping anything unnumbered or out of range
+    """
+    days_by_number: Dict[int, dict] = {}
+    for day_obj in days:
         try:
-            itinerary_data = json.loads(content)
-            itinerary_items = []
-            if isinstance(itinerary_data, list):
-                item_id = 1
-                for day_obj in itinerary_data:
-                    day_num = day_obj.get("day", "")
-                    expenses_by_category = day_obj.get("expenses", {})
-                    for category, activities in expenses_by_category.items():
-                        for activity in activities:
-                            title = activity.get("name", "")
-                            description = activity.get("description", "")
-                            cost = float(activity.get("cost", 0.0))
-                            time = activity.get("time", "")
-                            activity_category = activity.get("category", category)
-                            if is_food_item(title, description):
-                                activity_category = "food"
-                            itinerary_items.append(ItineraryItem(
-                                id=str(item_id),
-                                day=day_num,
-                                time=time,
-                                title=title,
-                                description=description,
-                                location=request.destination,
-                                type=activity_category,
-                                duration="",
-                                cost=cost,
-                                rating=4.5,
-                                completed=False
-                            ))
-                            item_id += 1
-
-
-            print("itinerary_items", itinerary_items)
-            return itinerary_items
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Raw response: {content}")
-            return generate_fallback_itinerary(request, num_days)
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
+            day_num = int(day_obj.get("day"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= day_num <= num_days and isinstance(day_obj.get("expenses"), dict):
+            days_by_number.setdefault(day_num, {**day_obj, "day": day_num})
+    return days_by_number
+
+def days_to_items(days_by_number: Dict[int, dict], request: ItineraryRequest) -> List[ItineraryItem]:
+    """
+    Convert day objects into itinerary items numbered in day order
+    """
+    with timed("model_construction"):
+        item_dicts = []
+        for day_num in sorted(days_by_number):
+            item_dicts.extend(day_to_item_dicts(days_by_number[day_num], request, len(item_dicts) + 1))
+        return ITINERARY_ITEMS_ADAPTER.validate_python(item_dicts)
+
+async def generate_itinerary(request: ItineraryRequest, allow_fallback: bool = True) -> List[ItineraryItem]:
+    """
+    Generate a personalized itinerary, serving repeated requests from the cache.
+    When the model fails, returns the generic fallback itinerary, or raises 502
+    if allow_fallback is False.
+    """
+    num_days, has_dates = prepare_request(request)
+    backend = resolve_backend(request)
+    cache_key = build_cache_key(request, num_days, backend.name)
+    cached_items = await get_cached_itinerary(cache_key)
+    if cached_items is not None:
+        return fit_generated_itinerary(cached_items, request)
+
+    async def complete_and_cache():
+        items = await request_itinerary_completion(request, num_days, has_dates, backend)
+        if items:
+            await store_cached_itinerary(cache_key, items)
+        return items
+
+    # Identical requests already in flight share one upstream completion
+    itinerary_items = await single_flight(cache_key, complete_and_cache)
+    if itinerary_items is None:
+        if not allow_fallback:
+            raise HTTPException(status_code=502, detail="Failed to generate itinerary")
         return generate_fallback_itinerary(request, num_days)
+    return fit_generated_itinerary([item.model_copy() for item in itinerary_items], request)
+
+def fit_generated_itinerary(items: List[ItineraryItem], request: ItineraryRequest) -> List[ItineraryItem]:
+    """
+    Drop items over the budget when ITINERARY_FIT_BUDGET is on. The cache keeps
+    the untrimmed itinerary, so changing the setting needs no invalidation.
+    """
+    if not ITINERARY_FIT_BUDGET:
+        return items
+    with timed("budget_fit"):
+        fitted_items, report = fit_to_budget(items, request.budget, request.travelers)
+    if report.dropped_ids:
+        logger.info(
+            "Trimmed itinerary to budget",
+            extra={"dropped": len(report.dropped_ids), "original_cost": report.original_cost,
+                   "total_cost": report.total_cost, "feasible": report.feasible},
+        )
+    return fitted_items
+
+async def single_flight(key: str, factory: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run factory() once per key at a time; concurrent callers with the same key
+    await the same result. A cancelled caller does not cancel the shared call.
+    """
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        single_flight_stats.coalesced += 1
+    return await asyncio.shield(future)
+
+async def generate_itineraries_batch(
+    requests: List[ItineraryRequest], max_concurrency: Optional[int] = None
+) -> List[ItineraryBatchResult]:
+    """
+    Generate many itineraries concurrently, at most max_concurrency at a time.
+    Duplicate requests are coalesced, and a failing request is reported in its
+    own result instead of failing the whole batch.
+    """
+    limiter = asyncio.Semaphore(max_concurrency or LLM_MAX_CONCURRENCY)
+
+    async def run(index: int, request: ItineraryRequest) -> ItineraryBatchResult:
+        async with limiter:
+            try:
+                itinerary = await generate_itinerary(request)
+                return ItineraryBatchResult(index=index, itinerary=itinerary)
+            except HTTPException as e:
+                return ItineraryBatchResult(index=index, error=str(e.detail))
+            except Exception:
+                logger.exception("Batch itinerary %d failed", index)
+                return ItineraryBatchResult(index=index, error="Failed to generate itinerary")
+
+    return list(await asyncio.gather(*(run(index, request) for index, request in enumerate(requests))))
+
+async def create_completion(
+    backend: LLMBackend, user_prompt: str, request: ItineraryRequest, num_days: int
+) -> Completion:
+    """
+    One completion in the configured response format, holding an LLM slot
+    for its duration
+    """
+    messages = build_messages(user_prompt, OBJECT_RESPONSE)
+    estimated_tokens = count_message_tokens(messages, backend.model)
+    # Bound the number of concurrent upstream calls; waiting requests fall back on timeout
+    async with llm_slot():
+        with timed("llm_call"):
+            completion = await asyncio.wait_for(
+                backend.complete(messages, request, num_days, **RESPONSE_FORMAT_OPTIONS),
+                timeout=LLM_TIMEOUT_SECONDS
+            )
+    record_token_usage(estimated_tokens, completion.usage, backend.name)
+    return completion
+
+async def request_missing_days(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend,
+    days_by_number: Dict[int, dict], missing_days: List[int]
+) -> Dict[int, dict]:
+    """
+    Ask the model for only the missing days. Returns the recovered days, or an
+    empty dict when the repair completion fails.
+    """
+    planned_names = [
+        activity.get("name", "")
+        for day_obj in days_by_number.values()
+        for activities in day_obj["expenses"].values()
+        for activity in activities
+    ]
+    prompt = build_repair_prompt(request, num_days, has_dates, missing_days, planned_names)
+    try:
+        completion = await create_completion(backend, prompt, request, num_days)
+    except asyncio.TimeoutError:
+        logger.warning("LLM error (%s): timed out waiting for repair completion", backend.name)
+        return {}
+    except Exception as e:
+        logger.warning("LLM error (%s) during repair: %s", backend.name, e)
+        return {}
+    with timed("json_parse"):
+        days, _ = parse_itinerary_payload(completion.content)
+    recovered = index_days(days, num_days)
+    return {day_num: recovered[day_num] for day_num in missing_days if day_num in recovered}
+
+def fill_missing_days(
+    itinerary_items: List[ItineraryItem], request: ItineraryRequest, num_days: int
+) -> List[ItineraryItem]:
+    """
+    Fill days the model never produced with fallback items and renumber ids
+    """
+    planned_days = {item.day for item in itinerary_items}
+    itinerary_items = itinerary_items + [
+        item for item in generate_fallback_itinerary(request, num_days)
+        if item.day not in planned_days
+    ]
+    itinerary_items.sort(key=lambda item: item.day)
+    for item_id, item in enumerate(itinerary_items, start=1):
+        item.id = str(item_id)
+    return itinerary_items
+
+async def request_itinerary_days(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend
+) -> Dict[int, dict]:
+    """One completion for the whole trip, parsed into day objects by day number"""
+    completion = await create_completion(backend, build_user_prompt(request, num_days, has_dates), request, num_days)
+    content = completion.content
+    with timed("json_parse"):
+        days, complete = parse_itinerary_payload(content)
+    days_by_number = index_days(days, num_days)
+    if not days_by_number:
+        logger.warning("Could not parse itinerary from completion", extra={"content_head": content[:200]})
+    elif len(days_by_number) < num_days:
+        logger.info(
+            "Itinerary missing days; requesting repair",
+            extra={"missing_days": [day for day in range(1, num_days + 1) if day not in days_by_number],
+                   "complete_json": complete},
+        )
+    return days_by_number
+
+def should_chunk(num_days: int) -> bool:
+    return 0 < ITINERARY_CHUNK_THRESHOLD_DAYS < num_days and num_days > ITINERARY_CHUNK_DAYS
+
+def plan_chunks(num_days: int, chunk_days: int = ITINERARY_CHUNK_DAYS) -> List[Tuple[int, int]]:
+    """
+    Split days 1..num_days into consecutive (first_day, last_day) ranges of at
+    most chunk_days, as even as possible (14 days -> 3, 3, 3, 3, 2)
+    """
+    count = -(-num_days // chunk_days)
+    size, extra = divmod(num_days, count)
+    chunks = []
+    first_day = 1
+    for index in range(count):
+        last_day = first_day + size - (0 if index < extra else 1)
+        chunks.append((first_day, last_day))
+        first_day = last_day + 1
+    return chunks
+
+def index_chunk_days(days: List[dict], first_day: int, last_day: int) -> Dict[int, dict]:
+    """
+    Map a chunk completion's day objects onto first_day..last_day. Models
+    sometimes number a chunk from 1 anyway; those days are shifted into place.
+    """
+    days_by_number = {
+        day_num: day_obj for day_num, day_obj in index_days(days, last_day).items() if day_num >= first_day
+    }
+    if days_by_number or first_day == 1:
+        return days_by_number
+    return {
+        first_day + day_num - 1: {**day_obj, "day": first_day + day_num - 1}
+        for day_num, day_obj in index_days(days, last_day - first_day + 1).items()
+    }
+
+async def request_chunk_days(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend,
+    chunks: List[Tuple[int, int]], index: int
+) -> Dict[int, dict]:
+    """One chunk of a long trip with its share of the budget; empty when the completion fails"""
+    first_day, last_day = chunks[index]
+    chunk_length = last_day - first_day + 1
+    budget_share = request.budget * chunk_length / num_days
+    prompt = build_chunk_prompt(request, num_days, has_dates, chunks, index, budget_share)
+    # Backends that plan from the request itself (rules, replay) plan just this chunk
+    chunk_request = request.model_copy(update={"budget": budget_share})
+    try:
+        completion = await create_completion(backend, prompt, chunk_request, chunk_length)
+    except asyncio.TimeoutError:
+        logger.warning("LLM error (%s): timed out waiting for days %d-%d", backend.name, first_day, last_day)
+        return {}
+    except Exception as e:
+        logger.warning("LLM error (%s) for days %d-%d: %s", backend.name, first_day, last_day, e)
+        return {}
+    with timed("json_parse"):
+        days, _ = parse_itinerary_payload(completion.content)
+    return index_chunk_days(days, first_day, last_day)
+
+def dedupe_activities(days_by_number: Dict[int, dict]) -> Dict[int, dict]:
+    """
+    Drop activities already planned on an earlier day, such as the same museum
+    picked by two chunks. Meals, transport and lodging may repeat.
+    """
+    seen = set()
+    deduped = {}
+    for day_num in sorted(days_by_number):
+        day_obj = days_by_number[day_num]
+        expenses = {}
+        for category, activities in day_obj["expenses"].items():
+            kept = []
+            for activity in activities:
+                if activity.get("category", category) not in REPEATABLE_CATEGORIES:
+                    name = " ".join(str(activity.get("name", "")).split()).casefold()
+                    if name in seen:
+                        continue
+                    seen.add(name)
+                kept.append(activity)
+            expenses[category] = kept
+        deduped[day_num] = {**day_obj, "expenses": expenses}
+    return deduped
+
+async def request_chunked_days(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend
+) -> Dict[int, dict]:
+    """
+    Generate a long trip as ITINERARY_CHUNK_DAYS-day chunks concurrently, each
+    given the shared outline and its budget share, and stitch them by day
+    """
+    chunks = plan_chunks(num_days)
+    results = await asyncio.gather(*(
+        request_chunk_days(request, num_days, has_dates, backend, chunks, index) for index in range(len(chunks))
+    ))
+    days_by_number: Dict[int, dict] = {}
+    for chunk_days in results:
+        days_by_number.update(chunk_days)
+    if days_by_number and len(days_by_number) < num_days:
+        logger.info(
+            "Itinerary chunks missing days; requesting repair",
+            extra={"missing_days": [day for day in range(1, num_days + 1) if day not in days_by_number],
+                   "chunks": len(chunks)},
+        )
+    return days_by_number
+
+async def request_itinerary_completion(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend
+) -> Optional[List[ItineraryItem]]:
+    """
+    Ask the LLM backend for an itinerary without blocking the event loop.
+
+    Long trips are generated in parallel chunks. Days lost to truncation are
+    requested again on their own instead of discarding the completion.
+    Returns None when the model fails or nothing usable could be parsed from
+    its output.
+    """
+    try:
+        chunked = should_chunk(num_days)
+        if chunked:
+            days_by_number = await request_chunked_days(request, num_days, has_dates, backend)
+        else:
+            days_by_number = await request_itinerary_days(request, num_days, has_dates, backend)
+        if not days_by_number:
+            return None
+        missing_days = [day_num for day_num in range(1, num_days + 1) if day_num not in days_by_number]
+        if missing_days:
+            days_by_number.update(
+                await request_missing_days(request, num_days, has_dates, backend, days_by_number, missing_days)
+            )
+        if chunked:
+            days_by_number = dedupe_activities(days_by_number)
+        itinerary_items = days_to_items(days_by_number, request)
+        if len(days_by_number) < num_days:
+            itinerary_items = fill_missing_days(itinerary_items, request, num_days)
+        return itinerary_items
+    except asyncio.TimeoutError:
+        logger.warning("LLM error (%s): timed out waiting for completion", backend.name)
+        return None
+    except Exception as e:
+        logger.warning("LLM error (%s): %s", backend.name, e)
+        return None
+
+def _activity_key(name) -> str:
+    return " ".join(str(name or "").split()).casefold()
+
+def _item_cost(item: dict) -> float:
+    # Stored items are untyped; anything unreadable counts as free
+    try:
+        return max(float(item.get("cost") or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def index_regenerated_days(days: List[dict], num_days: int, selected_days: List[int]) -> Dict[int, dict]:
+    """
+    Map a regeneration completion's day objects onto the selected days. Output
+    numbered 1..n instead of by trip day is assigned to them in order.
+    """
+    indexed = index_days(days, num_days)
+    days_by_number = {day_num: indexed[day_num] for day_num in selected_days if day_num in indexed}
+    if days_by_number:
+        return days_by_number
+    indexed = index_days(days, len(selected_days))
+    return {
+        day_num: {**indexed[position], "day": day_num}
+        for position, day_num in enumerate(selected_days, start=1) if position in indexed
+    }
+
+async def regenerate_itinerary_days(
+    request: ItineraryRequest, itinerary: List[dict], selected_days: List[int], feedback: Optional[str] = None
+) -> Tuple[List[dict], List[str], List[int]]:
+    """
+    Replan only selected_days of a stored itinerary, with the rest of the trip
+    as context. Completed items, and stored items without an id, are kept;
+    the others on those days are replaced by new items that take over their ids.
+
+    Returns (new_items, replaced_ids, regenerated_days). Days the model did
+    not return are left untouched.
+    """
+    num_days, has_dates = prepare_request(request)
+    if not has_dates:
+        # Undated trips are as long as their stored itinerary
+        num_days = max([num_days] + [item["day"] for item in itinerary if isinstance(item.get("day"), int)])
+    backend = resolve_backend(request)
+    selected_days = sorted(set(selected_days))
+    if any(day_num < 1 or day_num > num_days for day_num in selected_days):
+        raise HTTPException(status_code=400, detail=f"Days must be between 1 and {num_days}.")
+
+    selected = set(selected_days)
+    # Stored items are untyped dicts; ones without an id cannot be replaced in
+    # place, so they stay like completed items
+    def is_replaced(item: dict) -> bool:
+        return item.get("day") in selected and not item.get("completed") and bool(item.get("id"))
+
+    kept = [item for item in itinerary if not is_replaced(item)]
+    replaced = [item for item in itinerary if is_replaced(item)]
+    # Item costs are per traveler and the budget is for the whole party, as in fit_to_budget
+    kept_cost = sum(_item_cost(item) for item in kept) * max(request.travelers, 1)
+    budget_left = max(request.budget - kept_cost, 0.0)
+    prompt = build_regenerate_prompt(
+        request, num_days, has_dates, selected_days, budget_left,
+        [str(item.get("title") or "") for item in kept], [str(item.get("title") or "") for item in replaced],
+        feedback
+    )
+    # Backends that plan from the request itself (rules, replay) plan just these days
+    regenerate_request = request.model_copy(update={"budget": budget_left or request.budget})
+    try:
+        completion = await create_completion(backend, prompt, regenerate_request, len(selected_days))
+        with timed("json_parse"):
+            days, _ = parse_itinerary_payload(completion.content)
+        days_by_number = index_regenerated_days(days, num_days, selected_days)
+        if days_by_number and len(days_by_number) < len(selected_days):
+            missing_days = [day_num for day_num in selected_days if day_num not in days_by_number]
+            days_by_number.update(
+                await request_missing_days(request, num_days, has_dates, backend, days_by_number, missing_days)
+            )
+    except asyncio.TimeoutError:
+        logger.warning("LLM error (%s): timed out waiting for regeneration", backend.name)
+        days_by_number = {}
+    except Exception as e:
+        logger.warning("LLM error (%s) during regeneration: %s", backend.name, e)
+        days_by_number = {}
+    if not days_by_number:
+        raise HTTPException(status_code=502, detail="Failed to regenerate itinerary")
+
+    # Activities planned elsewhere in the trip are not repeated
+    planned = {_activity_key(item.get("title")) for item in kept if item.get("type") not in REPEATABLE_CATEGORIES}
+    new_items, replaced_ids = [], []
+    for day_num in sorted(days_by_number):
+        reusable_ids = [item["id"] for item in replaced if item.get("day") == day_num]
+        replaced_ids.extend(reusable_ids)
+        for item in day_to_item_dicts(days_by_number[day_num], request):
+            key = _activity_key(item["title"])
+            if item["type"] not in REPEATABLE_CATEGORIES:
+                if key in planned:
+                    continue
+                planned.add(key)
+            # Reuse the replaced items' ids so links to them keep working
+            item["id"] = reusable_ids.pop(0) if reusable_ids else str(ObjectId())
+            new_items.append(item)
+    with timed("model_construction"):
+        new_items = [item.model_dump() for item in ITINERARY_ITEMS_ADAPTER.validate_python(new_items)]
+    return new_items, replaced_ids, sorted(days_by_number)
+
+def stream_itinerary(request: ItineraryRequest) -> AsyncIterator[ItineraryItem]:
+    """
+    Validate the request and return an async iterator that yields itinerary
+    items day by day while the completion is still being generated
+    """
+    num_days, has_dates = prepare_request(request)
+    backend = resolve_backend(request)
+    return _stream_itinerary_items(request, num_days, has_dates, backend)
+
+async def _stream_itinerary_items(
+    request: ItineraryRequest, num_days: int, has_dates: bool, backend: LLMBackend
+) -> AsyncIterator[ItineraryItem]:
+    cache_key = build_cache_key(request, num_days, backend.name)
+    cached_items = await get_cached_itinerary(cache_key)
+    if cached_items is not None:
+        for item in cached_items:
+            yield item
+        return
+
+    messages = build_messages(build_user_prompt(request, num_days, has_dates), OBJECT_RESPONSE)
+    estimated_tokens = count_message_tokens(messages, backend.model)
+    usage = None
+    parser = IncrementalArrayParser()
+    days_by_number: Dict[int, dict] = {}
+    itinerary_items = []
+    try:
+        async with llm_slot():
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + LLM_TIMEOUT_SECONDS
+            stream = backend.stream(messages, request, num_days, **RESPONSE_FORMAT_OPTIONS)
+            # Includes the time the client takes to consume each item
+            with timed("llm_stream"):
+                async with aclosing(stream):
+                    async for delta in stream:
+                        if loop.time() > deadline:
+                            raise asyncio.TimeoutError
+                        usage = delta.usage or usage
+                        if not delta.content:
+                            continue
+                        for day_num, day_obj in index_days(parser.feed(delta.content), num_days).items():
+                            if day_num in days_by_number:
+                                continue
+                            days_by_number[day_num] = day_obj
+                            for item in day_to_items(day_obj, request, len(itinerary_items) + 1):
+                                itinerary_items.append(item)
+                                yield item
+    except asyncio.TimeoutError:
+        logger.warning("LLM error (%s): timed out waiting for completion", backend.name)
+    except Exception as e:
+        logger.warning("LLM error (%s): %s", backend.name, e)
+    if parser.started or usage is not None:
+        record_token_usage(estimated_tokens, usage, backend.name)
+
+    if not itinerary_items:
+        for item in generate_fallback_itinerary(request, num_days):
+            yield item
+        return
+
+    missing_days = [day_num for day_num in range(1, num_days + 1) if day_num not in days_by_number]
+    if missing_days:
+        # Stream whatever the repair recovers after the days already sent
+        recovered = await request_missing_days(request, num_days, has_dates, backend, days_by_number, missing_days)
+        for day_num in sorted(recovered):
+            days_by_number[day_num] = recovered[day_num]
+            for item in day_to_items(recovered[day_num], request, len(itinerary_items) + 1):
+                itinerary_items.append(item)
+                yield item
+    if len(days_by_number) == num_days:
+        await store_cached_itinerary(cache_key, sorted(itinerary_items, key=lambda item: item.day))
 
 def generate_fallback_itinerary(request: ItineraryRequest, num_days: int) -> List[ItineraryItem]:
     """
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+from database import require_connection, store
+from itinerary_cache import build_cache_key
+from itinerary_service import LLM_DRAIN_TIMEOUT_SECONDS, generate_itinerary, prepare_request, resolve_backend
+from models import ItineraryRequest
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Job runners per worker process; each runs one generation at a time
+ITINERARY_JOB_WORKERS = int(os.getenv("ITINERARY_JOB_WORKERS", "4"))
+# Finished (and abandoned) jobs are deleted this long after they were submitted
+ITINERARY_JOB_TTL_SECONDS = int(os.getenv("ITINERARY_JOB_TTL_SECONDS", "86400"))
+# A running job whose lease runs out (its worker died) is picked up again
+ITINERARY_JOB_LEASE_SECONDS = int(os.getenv("ITINERARY_JOB_LEASE_SECONDS", "300"))
+# How often a running job's lease is pushed forward; well under the lease so one missed renewal is harmless
+ITINERARY_JOB_HEARTBEAT_SECONDS = float(
+    os.getenv("ITINERARY_JOB_HEARTBEAT_SECONDS", str(ITINERARY_JOB_LEASE_SECONDS / 3))
+)
+ITINERARY_JOB_MAX_ATTEMPTS = int(os.getenv("ITINERARY_JOB_MAX_ATTEMPTS", "3"))
+# How often idle runners and long-polling clients re-check MongoDB
+ITINERARY_JOB_POLL_SECONDS = float(os.getenv("ITINERARY_JOB_POLL_SECONDS", "1"))
+ITINERARY_JOB_MAX_WAIT_SECONDS = float(os.getenv("ITINERARY_JOB_MAX_WAIT_SECONDS", "30"))
+ITINERARY_JOBS_COLLECTION = "itinerary_jobs"
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class JobRunnerState:
+    tasks: List[asyncio.Task] = []
+    stopping: Optional[asyncio.Event] = None
+    wakeup: Optional[asyncio.Event] = None
+    # Set (and replaced) whenever a job finishes in this process, so long polls here return at once
+    finished: Optional[asyncio.Event] = None
+
+
+runner = JobRunnerState()
+
+
+def _finished_event() -> asyncio.Event:
+    if runner.finished is None:
+        runner.finished = asyncio.Event()
+    return runner.finished
+
+
+def _jobs() -> AsyncCollection:
+    require_connection()
+    return store.database[ITINERARY_JOBS_COLLECTION]
+
+
+async def ensure_job_indexes(database: AsyncDatabase):
+    """Create the dedup, queue and TTL indexes of the jobs collection"""
+    await database[ITINERARY_JOBS_COLLECTION].create_indexes([
+        IndexModel([("fingerprint", ASCENDING)], name="fingerprint_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease_expires_at"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=ITINERARY_JOB_TTL_SECONDS),
+    ])
+
+
+def job_fingerprint(request: ItineraryRequest) -> str:
+    """Requests that would share an itinerary cache entry share a job"""
+    request = request.model_copy(deep=True)
+    num_days, _ = prepare_request(request)
+    return build_cache_key(request, num_days, resolve_backend(request).name)
+
+
+def job_document_to_response(job: dict) -> dict:
+    response = {
+        "id": job["_id"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "itinerary": job.get("result"),
+        "error": job.get("error"),
+    }
+    if (
+        job["status"] == "running" and job.get("attempts", 0) >= ITINERARY_JOB_MAX_ATTEMPTS
+        and job.get("lease_expires_at") and job["lease_expires_at"] < datetime.utcnow()
+    ):
+        # Its last worker died and nobody may claim it again
+        response["status"] = "failed"
+        response["error"] = "Job was interrupted too many times"
+    return response
+
+
+async def submit_job(request: ItineraryRequest) -> dict:
+    """
+    Queue an itinerary generation, or return the existing job for the same
+    fingerprint. A failed job is queued again.
+    """
+    fingerprint = job_fingerprint(request)
+    jobs = _jobs()
+    now = datetime.utcnow()
+    try:
+        job = await jobs.find_one_and_update(
+            {"fingerprint": fingerprint},
+            {"$setOnInsert": {
+                "fingerprint": fingerprint,
+                "request": request.model_dump(),
+                "status": "queued",
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now,
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent submit inserted it first
+        job = await jobs.find_one({"fingerprint": fingerprint})
+    if job_document_to_response(job)["status"] == "failed":
+        job = await jobs.find_one_and_update(
+            {"_id": job["_id"], "status": job["status"]},
+            {
+                "$set": {"status": "queued", "attempts": 0, "updated_at": now, "created_at": now},
+                "$unset": {"error": "", "lease_owner": "", "lease_expires_at": ""},
+            },
+            return_document=ReturnDocument.AFTER
+        ) or job
+    if job["status"] == "queued" and runner.wakeup is not None:
+        runner.wakeup.set()
+    return job
+
+
+async def get_job(job_id: str, wait: float = 0) -> Optional[dict]:
+    """
+    Fetch a job; with wait, block up to that many seconds for it to finish.
+    Jobs finishing in this process wake the caller at once, others are
+    noticed within ITINERARY_JOB_POLL_SECONDS.
+    """
+    if not ObjectId.is_valid(job_id):
+        return None
+    jobs = _jobs()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(wait, ITINERARY_JOB_MAX_WAIT_SECONDS)
+    while True:
+        job = await jobs.find_one({"_id": ObjectId(job_id)}, {"request": 0})
+        remaining = deadline - loop.time()
+        if job is None or job_document_to_response(job)["status"] in FINISHED_STATUSES or remaining <= 0:
+            return job
+        try:
+            await asyncio.wait_for(_finished_event().wait(), timeout=min(ITINERARY_JOB_POLL_SECONDS, remaining))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def claim_job(worker_id: str) -> Optional[dict]:
+    """
+    Lease the oldest queued job, or a running one whose worker stopped
+    renewing its lease (see renew_lease) and is presumed dead
+    """
+    jobs = _jobs()
+    now = datetime.utcnow()
+    lease = {"$set": {
+        "status": "running",
+        "lease_owner": worker_id,
+        "lease_expires_at": now + timedelta(seconds=ITINERARY_JOB_LEASE_SECONDS),
+        "updated_at": now,
+    }, "$inc": {"attempts": 1}}
+    for query in (
+        {"status": "queued"},
+        {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$lt": ITINERARY_JOB_MAX_ATTEMPTS}},
+    ):
+        job = await jobs.find_one_and_update(
+            query, lease, sort=[("created_at", ASCENDING)], return_document=ReturnDocument.AFTER
+        )
+        if job is not None:
+            return job
+    return None
+
+
+async def _finish_job(job: dict, worker_id: str, update: dict):
+    # Conditional on the lease so a worker that lost its job cannot overwrite the new owner's result
+    await _jobs().update_one(
+        {"_id": job["_id"], "lease_owner": worker_id},
+        {"$set": {**update, "updated_at": datetime.utcnow()}, "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    )
+    event, runner.finished = _finished_event(), asyncio.Event()
+    event.set()
+
+
+async def renew_lease(job: dict, worker_id: str):
+    """Extend the job's lease every heartbeat while this worker holds it"""
+    while True:
+        await asyncio.sleep(ITINERARY_JOB_HEARTBEAT_SECONDS)
+        try:
+            result = await _jobs().update_one(
+                {"_id": job["_id"], "lease_owner": worker_id},
+                {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=ITINERARY_JOB_LEASE_SECONDS)}}
+            )
+        except Exception as e:
+            logger.warning("Renewing the lease on itinerary job %s failed: %s", job["_id"], e)
+            continue
+        if result.matched_count == 0:
+            logger.warning("Lost the lease on itinerary job %s", job["_id"])
+            return
+
+
+async def run_job(job: dict, worker_id: str):
+    heartbeat = asyncio.create_task(renew_lease(job, worker_id))
+    try:
+        await _run_job(job, worker_id)
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_job(job: dict, worker_id: str):
+    try:
+        # A fallback itinerary would be served to every identical submission
+        # until the job expires, so the job fails instead (and is retried on resubmit)
+        items = await generate_itinerary(ItineraryRequest(**job["request"]), allow_fallback=False)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job straight back to the queue without using up an attempt
+        await _finish_job(job, worker_id, {"status": "queued", "attempts": job["attempts"] - 1})
+        raise
+    except HTTPException as e:
+        await _finish_job(job, worker_id, {"status": "failed", "error": str(e.detail)})
+        return
+    except Exception:
+        logger.exception("Itinerary job %s failed", job["_id"])
+        await _finish_job(job, worker_id, {"status": "failed", "error": "Failed to generate itinerary"})
+        return
+    await _finish_job(job, worker_id, {"status": "succeeded", "result": [item.model_dump() for item in items]})
+
+
+async def job_worker(worker_id: str):
+    """Claim and run jobs until the runner stops"""
+    while not runner.stopping.is_set():
+        try:
+            job = await claim_job(worker_id)
+        except Exception as e:
+            logger.warning("Claiming an itinerary job failed: %s", e)
+            job = None
+        if job is not None:
+            await run_job(job, worker_id)
+            continue
+        runner.wakeup.clear()
+        try:
+            await asyncio.wait_for(runner.wakeup.wait(), timeout=ITINERARY_JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_job_workers():
+    """Start this process's job runners; called from the app lifespan"""
+    if runner.tasks or ITINERARY_JOB_WORKERS <= 0:
+        return
+    runner.stopping = asyncio.Event()
+    runner.wakeup = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    runner.tasks = [
+        asyncio.create_task(job_worker(f"{prefix}:{index}")) for index in range(ITINERARY_JOB_WORKERS)
+    ]
+
+
+async def stop_job_workers(timeout: float = LLM_DRAIN_TIMEOUT_SECONDS):
+    """
+    Stop claiming jobs and give running ones up to timeout seconds; the rest
+    are cancelled and go back to the queue for another worker
+    """
+    if not runner.tasks:
+        return
+    runner.stopping.set()
+    runner.wakeup.set()
+    _, pending = await asyncio.wait(runner.tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if pending:
+        logger.warning("Requeued %d unfinished itinerary jobs on shutdown", len(pending))
+    runner.tasks = []
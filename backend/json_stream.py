@@ -0,0 +1,60 @@
+import json
+from typing import Any, List
+
+
+class IncrementalArrayParser:
+    """
+    Incrementally parse the first JSON array found in a stream of text chunks.
+
+    Each object element is returned from feed() as soon as its closing brace
+    arrives, so callers can act on it before the rest of the array has been
+    received. Text before the opening bracket (such as a markdown fence) is
+    skipped.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buf: List[str] = []
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume a chunk and return the elements it completed"""
+        elements = []
+        for ch in text:
+            if self.complete:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                    self._depth = 1
+                continue
+            if self._depth > 1:
+                self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                if self._depth == 1:
+                    self._buf = [ch]
+                self._depth += 1
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+                if self._depth == 1:
+                    try:
+                        elements.append(json.loads("".join(self._buf)))
+                    except json.JSONDecodeError:
+                        pass
+                    self._buf = []
+                elif self._depth == 0:
+                    self.complete = True
+        return elements
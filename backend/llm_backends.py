@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from openai.types import CompletionUsage
+
+from clients import LLM_TIMEOUT_SECONDS, get_openai_client
+from models import ItineraryRequest
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Backend used when a request does not pick one: "openai", "replay" or "rules"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
+# Backends a request may pick with its "backend" field; empty disables overrides
+LLM_BACKEND_OVERRIDES = {
+    name.strip().lower() for name in os.getenv("LLM_BACKEND_OVERRIDES", "").split(",") if name.strip()
+}
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Append every OpenAI completion to this JSONL file for the replay backend
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+# Recorded completions served by the replay backend; rule-based output when unset
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "")
+# fixed:<ms>, uniform:<min_ms>,<max_ms>, normal:<mean_ms>,<stddev_ms> or lognormal:<median_ms>,<sigma>
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "lognormal:1500,0.4")
+LLM_REPLAY_CHUNK_CHARS = int(os.getenv("LLM_REPLAY_CHUNK_CHARS", "64"))
+LLM_REPLAY_SEED = os.getenv("LLM_REPLAY_SEED")
+
+
+class Completion:
+    """Content of a completion (or one streamed delta) and its token usage, if reported"""
+
+    def __init__(self, content: str, usage=None):
+        self.content = content
+        self.usage = usage
+
+
+class LLMBackend:
+    """
+    Produces the day/expenses completion for an itinerary prompt.
+
+    Backends receive the chat messages along with the validated request so
+    local backends can answer without a model.
+    """
+    name = ""
+    model: Optional[str] = None
+
+    async def complete(
+        self, messages: List[dict], request: ItineraryRequest, num_days: int, **options
+    ) -> Completion:
+        raise NotImplementedError
+
+    async def stream(
+        self, messages: List[dict], request: ItineraryRequest, num_days: int, **options
+    ) -> AsyncIterator[Completion]:
+        """Yield content deltas; the last one may carry usage"""
+        completion = await self.complete(messages, request, num_days, **options)
+        yield completion
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+    model = OPENAI_MODEL
+
+    async def complete(self, messages, request, num_days, **options) -> Completion:
+        response = await get_openai_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=2500,
+            **options
+        )
+        completion = Completion(response.choices[0].message.content or "", getattr(response, "usage", None))
+        await record_completion(completion)
+        return completion
+
+    async def stream(self, messages, request, num_days, **options) -> AsyncIterator[Completion]:
+        stream = await asyncio.wait_for(
+            get_openai_client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=2500,
+                stream=True,
+                # The final chunk then reports token usage
+                stream_options={"include_usage": True},
+                **options
+            ),
+            timeout=LLM_TIMEOUT_SECONDS
+        )
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield Completion(delta)
+                elif usage is not None:
+                    yield Completion("", usage)
+        finally:
+            await stream.close()
+        await record_completion(Completion("".join(parts), usage))
+
+
+def _write_recording(line: str):
+    with open(LLM_RECORD_PATH, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+async def record_completion(completion: Completion):
+    """Append a completion to LLM_RECORD_PATH so it can be replayed offline"""
+    if not LLM_RECORD_PATH or not completion.content:
+        return
+    usage = completion.usage
+    line = json.dumps({
+        "content": completion.content,
+        "usage": usage.model_dump() if hasattr(usage, "model_dump") else None,
+    })
+    try:
+        await asyncio.to_thread(_write_recording, line)
+    except OSError as e:
+        logger.warning("Could not record completion: %s", e)
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    """Parse a LLM_REPLAY_LATENCY spec into (distribution, parameters)"""
+    distribution, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value.strip()]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if expected.get(distribution) != len(values):
+        raise ValueError(f"Invalid LLM_REPLAY_LATENCY: {spec!r}")
+    return distribution, values
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Serves recorded completions in turn after a latency drawn from
+    LLM_REPLAY_LATENCY. Without recordings it replays rule-based output, so
+    load tests and capacity planning need no network access.
+    """
+    name = "replay"
+
+    def __init__(self, path: str = LLM_REPLAY_PATH, latency: str = LLM_REPLAY_LATENCY):
+        self.recordings = load_recordings(path) if path else []
+        self.distribution, self.params = parse_latency(latency)
+        self.random = random.Random(LLM_REPLAY_SEED)
+        self._next = 0
+
+    def sample_latency(self) -> float:
+        """Seconds to wait before the completion is ready"""
+        if self.distribution == "fixed":
+            ms = self.params[0]
+        elif self.distribution == "uniform":
+            ms = self.random.uniform(*self.params)
+        elif self.distribution == "normal":
+            ms = self.random.gauss(*self.params)
+        else:
+            median_ms, sigma = self.params
+            ms = median_ms * self.random.lognormvariate(0, sigma)
+        return max(ms, 0.0) / 1000
+
+    def next_completion(self, request: ItineraryRequest, num_days: int) -> Completion:
+        if not self.recordings:
+            return Completion(json.dumps(build_rule_based_days(request, num_days)))
+        recording = self.recordings[self._next % len(self.recordings)]
+        self._next += 1
+        usage = recording.get("usage")
+        return Completion(recording["content"], CompletionUsage.model_validate(usage) if usage else None)
+
+    async def complete(self, messages, request, num_days, **options) -> Completion:
+        completion = self.next_completion(request, num_days)
+        await asyncio.sleep(self.sample_latency())
+        return completion
+
+    async def stream(self, messages, request, num_days, **options) -> AsyncIterator[Completion]:
+        completion = self.next_completion(request, num_days)
+        content = completion.content
+        chunks = [content[i:i + LLM_REPLAY_CHUNK_CHARS] for i in range(0, len(content), LLM_REPLAY_CHUNK_CHARS)]
+        # Spread the sampled latency across the chunks like a model emitting tokens
+        delay = self.sample_latency() / max(len(chunks), 1)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield Completion(chunk)
+        if completion.usage is not None:
+            yield Completion("", completion.usage)
+
+
+def load_recordings(path: str) -> List[dict]:
+    """Read the JSONL recordings written via LLM_RECORD_PATH"""
+    recordings = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                recordings.append(json.loads(line))
+    logger.info("Loaded %d recorded completions from %s", len(recordings), path)
+    return recordings
+
+
+# (title, description, category) templates per interest, filled with the destination
+RULE_ACTIVITIES: Dict[str, List[Tuple[str, str, str]]] = {
+    "culture": [
+        ("{destination} History Museum", "Exhibits on the history of {destination}", "activities"),
+        ("Old Town Walking Tour", "Guided walk through the historic center", "activities"),
+        ("Cathedral Visit", "Architecture and local heritage", "activities"),
+    ],
+    "art": [
+        ("{destination} Art Gallery", "Local and international collections", "activities"),
+        ("Street Art Walk", "Murals and independent studios", "activities"),
+    ],
+    "nature": [
+        ("Botanical Garden", "Gardens and greenhouses", "activities"),
+        ("Scenic Hike", "Trail with views over {destination}", "activities"),
+        ("Riverside Park", "Relaxed walk along the water", "activities"),
+    ],
+    "shopping": [
+        ("Local Market", "Crafts, produce and souvenirs", "shopping"),
+        ("Boutique District", "Independent shops and designers", "shopping"),
+    ],
+    "nightlife": [
+        ("Live Music Show", "Evening concert in a local venue", "entertainment"),
+        ("Theater Performance", "An evening at the theater", "entertainment"),
+    ],
+    "food": [
+        ("Food Market Tasting", "Sample regional specialties", "food"),
+        ("Cooking Class", "Learn a local dish from a chef", "food"),
+    ],
+}
+RULE_INTEREST_ALIASES = {
+    "museums": "culture", "history": "culture", "culture": "culture", "architecture": "culture",
+    "art": "art", "galleries": "art",
+    "nature": "nature", "outdoors": "nature", "hiking": "nature", "parks": "nature", "adventure": "nature",
+    "shopping": "shopping",
+    "nightlife": "nightlife", "music": "nightlife", "entertainment": "nightlife",
+    "food": "food", "cuisine": "food", "restaurants": "food",
+}
+# Share of the daily budget per slot
+RULE_BUDGET_SHARES = {"breakfast": 0.05, "transport": 0.04, "morning": 0.12, "lunch": 0.10, "afternoon": 0.12, "dinner": 0.15}
+
+
+def build_rule_based_days(request: ItineraryRequest, num_days: int) -> List[dict]:
+    """
+    Deterministic day/expenses payload for a request: meals, local transport
+    and two activities per day drawn from the traveler's interests, costed
+    from the daily budget. A richer stand-in than generate_fallback_itinerary
+    that goes through the same parsing path as model output.
+    """
+    interests = []
+    for preference in request.preferences:
+        for word, interest in RULE_INTEREST_ALIASES.items():
+            if word in preference.casefold() and interest not in interests:
+                interests.append(interest)
+    pool = [activity for interest in interests or ["culture", "nature"] for activity in RULE_ACTIVITIES[interest]]
+    daily_budget = request.budget / max(num_days, 1)
+
+    def activity(name, description, cost_share, time, category):
+        return {
+            "name": name.format(destination=request.destination),
+            "description": description.format(destination=request.destination),
+            "cost": round(daily_budget * cost_share, 2),
+            "time": time,
+            "category": category,
+        }
+
+    days = []
+    for day in range(1, num_days + 1):
+        morning = pool[(2 * day - 2) % len(pool)]
+        afternoon = pool[(2 * day - 1) % len(pool)]
+        days.append({"day": day, "expenses": {
+            "food": [
+                activity("Breakfast at a Local Cafe", "Coffee and pastries", RULE_BUDGET_SHARES["breakfast"], "08:00", "food"),
+                activity("Lunch at a Neighborhood Restaurant", "Regional cuisine", RULE_BUDGET_SHARES["lunch"], "12:30", "food"),
+                activity("Dinner in {destination}", "Evening meal at a recommended restaurant", RULE_BUDGET_SHARES["dinner"], "19:00", "food"),
+            ],
+            "transportation": [
+                activity("Public Transport Day Pass", "Metro and bus travel around {destination}", RULE_BUDGET_SHARES["transport"], "08:45", "transportation"),
+            ],
+            "activities": [
+                activity(*morning[:2], RULE_BUDGET_SHARES["morning"], "09:30", morning[2]),
+                activity(*afternoon[:2], RULE_BUDGET_SHARES["afternoon"], "15:00", afternoon[2]),
+            ],
+        }})
+    return days
+
+
+class RuleBasedBackend(LLMBackend):
+    """In-process generator with no latency, for CI and post-processing benchmarks"""
+    name = "rules"
+
+    async def complete(self, messages, request, num_days, **options) -> Completion:
+        return Completion(json.dumps(build_rule_based_days(request, num_days)))
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    ReplayBackend.name: ReplayBackend,
+    RuleBasedBackend.name: RuleBasedBackend,
+}
+_instances: Dict[str, LLMBackend] = {}
+
+
+def get_backend(name: Optional[str] = None) -> LLMBackend:
+    """
+    Return the backend for a request's override (if allowed) or the
+    deployment default. Raises ValueError for unknown or disallowed names.
+    """
+    name = (name or LLM_BACKEND).strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}'")
+    if name != LLM_BACKEND and name not in LLM_BACKEND_OVERRIDES:
+        raise ValueError(f"LLM backend '{name}' is not enabled for this deployment")
+    backend = _instances.get(name)
+    if backend is None:
+        backend = _instances[name] = BACKENDS[name]()
+    return backend
@@ -0,0 +1,141 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "pymongo=WARNING,itinerary_service=DEBUG"; these
+# defaults keep the chattiest libraries quiet unless asked for
+DEFAULT_LOG_LEVELS = "pymongo=WARNING,httpx=WARNING,httpcore=WARNING,openai=WARNING,passlib=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# "json" for one structured record per line, "text" for local development
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fraction of DEBUG records kept, e.g. 0.01 for chatty production debugging;
+# unset keeps them all. INFO and above are never sampled
+LOG_DEBUG_SAMPLE_RATE = os.getenv("LOG_DEBUG_SAMPLE_RATE")
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps each record with the current request ID while still on the caller's task"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps one in every 1/rate DEBUG records and every record above DEBUG"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        if not self.every:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def parse_log_levels(spec: str) -> Dict[str, str]:
+    """Parse "name=LEVEL,name=LEVEL" into a mapping"""
+    levels = {}
+    for pair in spec.split(","):
+        name, _, level = pair.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    Route all logging through a queue so the event loop only enqueues records;
+    a background thread formats and writes them. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if LOG_DEBUG_SAMPLE_RATE:
+        queue_handler.addFilter(DebugSamplingFilter(float(LOG_DEBUG_SAMPLE_RATE)))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    levels = parse_log_levels(DEFAULT_LOG_LEVELS)
+    levels.update(parse_log_levels(LOG_LEVELS))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    # Let uvicorn's loggers go through the queue too instead of their own stream handlers
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers[:] = []
+        logging.getLogger(name).propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Flush queued records and stop the writer thread; records logged after
+    that are written directly by the same handlers.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        root = logging.getLogger()
+        filters = [log_filter for handler in root.handlers for log_filter in handler.filters]
+        for handler in _listener.handlers:
+            for log_filter in filters:
+                handler.addFilter(log_filter)
+        root.handlers[:] = list(_listener.handlers)
+        _listener = None
@@ -1,33 +1,90 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer
-from pymongo.database import Database
-from datetime import timedelta
+from pydantic import ValidationError
+from datetime import datetime, timedelta
 from bson import ObjectId
-import os
+from typing import List, Literal, Optional
+import asyncio
+import time
 from dotenv import load_dotenv
 from fastapi import Request
+from contextlib import asynccontextmanager
 
 
 import logging
+import uuid
 
-logging.basicConfig(level=logging.DEBUG)
+from logging_config import request_id_var, setup_logging, stop_logging
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
-from database import connect_to_mongo, close_mongo_connection, get_database, is_connected
+from database import (
+    connect_to_mongo, close_mongo_connection, get_trips, get_users, is_connected, get_pool_stats, store
+)
 from models import (
-    UserCreate, UserLogin, UserResponse, Token, TripCreate, Trip, User,
-    ItineraryRequest, ItineraryResponse
+    UserCreate, UserLogin, UserResponse, Token, TripCreate, TripUpdate, User,
+    ItineraryRequest, ItineraryResponse, ItineraryItem, ItineraryItemUpdate,
+    ItineraryBatchRequest, ItineraryBatchResponse, ItineraryJob, ItineraryRegenerateRequest,
+    BudgetFitRequest, BudgetFitResponse,
+    TripCollection, TripItemBatch, TripResponse
 )
 from auth import (
-    get_password_hash, authenticate_user, create_access_token, 
-    get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES
+    hash_password_async, authenticate_user, create_access_token,
+    get_current_active_user, shutdown_password_executor, get_password_hash_stats,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from itinerary_service import (
+    generate_itinerary, generate_itineraries_batch, stream_itinerary, get_llm_slot_stats,
+    drain_llm_calls, regenerate_itinerary_days, LLM_DRAIN_TIMEOUT_SECONDS, LLM_MAX_CONCURRENCY
+)
+from budget_optimizer import fit_to_budget
+from repositories import TripRepository, UserRepository
+from jobs import (
+    FINISHED_STATUSES, ITINERARY_JOB_MAX_WAIT_SECONDS, ensure_job_indexes, get_job, job_document_to_response,
+    start_job_workers, stop_job_workers, submit_job
 )
-from itinerary_service import generate_itinerary
+from clients import init_clients, close_clients, get_http_pool_stats
+from itinerary_cache import ITINERARY_CACHE_MONGO, ensure_cache_indexes, get_cache_stats
+from prompts import get_prompt_token_stats
+from llm_backends import OPENAI_MODEL
+from metrics import METRICS_ENABLED, http_request_duration, render_metrics
+from responses import FastJSONResponse, dumps, json_model_response
 
 load_dotenv()
 
-app = FastAPI(title="Travel Planner API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared MongoDB and LLM API clients once per worker process"""
+    await connect_to_mongo()
+    if ITINERARY_CACHE_MONGO and is_connected():
+        await ensure_cache_indexes(store.database)
+    init_clients()
+    if is_connected():
+        await ensure_job_indexes(store.database)
+        start_job_workers()
+    yield
+    # Requests have drained by now. Running jobs and detached generations share
+    # one LLM_DRAIN_TIMEOUT_SECONDS budget, so shutdown takes at most
+    # GRACEFUL_SHUTDOWN_SECONDS + LLM_DRAIN_TIMEOUT_SECONDS (see supervisord.conf)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_DRAIN_TIMEOUT_SECONDS
+    await stop_job_workers(timeout=LLM_DRAIN_TIMEOUT_SECONDS)
+    unfinished = await drain_llm_calls(timeout=max(deadline - loop.time(), 0))
+    if unfinished:
+        logger.warning("Shutting down with %d LLM calls still in flight", unfinished)
+    await close_mongo_connection()
+    await close_clients()
+    shutdown_password_executor()
+    stop_logging()
+
+app = FastAPI(
+    title="Travel Planner API", version="1.0.0", lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
 
 # CORS middleware
 app.add_middleware(
@@ -43,59 +100,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Request-ID"],
 )
 
 security = HTTPBearer()
 
-@app.on_event("startup")
-async def startup_db_client():
-    connect_to_mongo()
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    close_mongo_connection()
+DEFAULT_TRIPS_PAGE_SIZE = 20
+MAX_TRIPS_PAGE_SIZE = 100
+TRIPS_STREAM_BATCH_SIZE = 100
+# Trip listing fields returned with view=summary; the embedded arrays can be large
+TRIP_SUMMARY_PROJECTION = {"itinerary": 0, "flights": 0, "expenses": 0}
 
 @app.get("/")
 async def root():
     return {"message": "Travel Planner API"}
 
+@app.get("/health/pools")
+async def pool_stats():
+    """Connection pool and LLM concurrency statistics for this worker"""
+    return {
+        "mongo": get_pool_stats(),
+        "llm_http": get_http_pool_stats(),
+        "llm_slots": get_llm_slot_stats(),
+        "password_hashing": get_password_hash_stats(),
+    }
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.debug(f"Incoming request: {request.method} {request.url}")
+async def request_context(request: Request, call_next):
+    """Tag every log record made while handling the request with its request ID"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        start = time.perf_counter()
+        response = await call_next(request)
+        logger.debug(
+            "request completed",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            },
+        )
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        request_id_var.reset(token)
+
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
     response = await call_next(request)
-    logger.debug(f"Response status: {response.status_code}")
+    # Label by route template so ids in the path do not create new series
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        time.perf_counter() - start,
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    )
     return response
 
+if METRICS_ENABLED:
+    app.middleware("http")(record_request_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus-style latency histograms and token counters (METRICS_ENABLED=true)"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/auth/signup", response_model=UserResponse)
-async def signup(user_data: UserCreate, db: Database = Depends(get_database)):
+async def signup(user_data: UserCreate, users: UserRepository = Depends(get_users)):
     """Create a new user account"""
-    if not is_connected():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available. Please check MongoDB connection."
-        )
-    
     # Check if user already exists
-    logger.debug(f"Signup attempt for email: {user_data.email}")
-    if db.users.find_one({"email": user_data.email}):
+    if await users.email_exists(user_data.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    user_dict = {
-        "email": user_data.email,
-        "full_name": user_data.full_name,
-        "hashed_password": hashed_password,
-        "is_active": True
-    }
-    
-    result = db.users.insert_one(user_dict)
-    user_dict["_id"] = str(result.inserted_id)
-    
-    user = User(**user_dict)
+    hashed_password = await hash_password_async(user_data.password)
+    user = await users.create(user_data.email, user_data.full_name, hashed_password)
     return UserResponse(
         id=str(user.id),
         email=user.email,
@@ -105,15 +190,9 @@ async def signup(user_data: UserCreate, db: Database = Depends(get_database)):
     )
 
 @app.post("/auth/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Database = Depends(get_database)):
+async def login(user_credentials: UserLogin, users: UserRepository = Depends(get_users)):
     """Authenticate user and return access token"""
-    if not is_connected():
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database not available. Please check MongoDB connection."
-        )
-    
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+    user = await authenticate_user(users, user_credentials.email, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -142,80 +221,481 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
 async def generate_trip_itinerary(request: ItineraryRequest):
     """Generate a personalized itinerary using OpenAI"""
     try:
-        itinerary_items = generate_itinerary(request)
-        return ItineraryResponse(itinerary=itinerary_items)
-    except Exception as e:
-        logger.error(f"Error generating itinerary: {e}")
+        itinerary_items = await generate_itinerary(request)
+        # The items were validated when they were built; skip response_model re-validation
+        return json_model_response(ItineraryResponse.model_construct(itinerary=itinerary_items))
+    except HTTPException:
+        # e.g. 400 for a backend override that is not enabled
+        raise
+    except Exception:
+        logger.exception("Error generating itinerary")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to generate itinerary"
     )
 
-@app.post("/trips", response_model=dict)
+@app.post("/itinerary/generate/batch", response_model=ItineraryBatchResponse)
+async def generate_trip_itineraries_batch(batch: ItineraryBatchRequest):
+    """Generate many itineraries concurrently; results are returned in request order"""
+    max_concurrency = min(batch.max_concurrency or LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY)
+    results = await generate_itineraries_batch(batch.requests, max_concurrency)
+    return json_model_response(ItineraryBatchResponse.model_construct(results=results))
+
+@app.post("/itinerary/generate/stream")
+async def stream_trip_itinerary(request: ItineraryRequest):
+    """Stream itinerary items as newline-delimited JSON while the days are generated"""
+    itinerary_items = stream_itinerary(request)
+
+    async def ndjson_lines():
+        async for item in itinerary_items:
+            yield item.model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@app.post("/itinerary/fit-budget", response_model=BudgetFitResponse)
+async def fit_itinerary_budget(fit: BudgetFitRequest):
+    """
+    Trim an itinerary to a budget and daily time window without another
+    generation, with a report of what was dropped and what could not be met
+    """
+    try:
+        itinerary_items, report = fit_to_budget(
+            fit.itinerary, fit.budget, fit.travelers, fit.day_start, fit.day_end, fit.min_food_per_day
+        )
+    except ValueError as e:
+        # Only one end of the window was given and it falls on the wrong side of the default
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return json_model_response(BudgetFitResponse.model_construct(itinerary=itinerary_items, report=report))
+
+@app.post("/itinerary/jobs", response_model=ItineraryJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_itinerary_job(request: ItineraryRequest):
+    """
+    Queue an itinerary generation and return its job immediately. Identical
+    requests share one job; poll GET /itinerary/jobs/{job_id} for the result.
+    """
+    job = job_document_to_response(await submit_job(request))
+    return FastJSONResponse(
+        job,
+        status_code=status.HTTP_200_OK if job["status"] in FINISHED_STATUSES else status.HTTP_202_ACCEPTED,
+        headers={"Location": f"/itinerary/jobs/{job['id']}"}
+    )
+
+@app.get("/itinerary/jobs/{job_id}", response_model=ItineraryJob)
+async def get_itinerary_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=ITINERARY_JOB_MAX_WAIT_SECONDS, description="Seconds to wait for the job to finish")
+):
+    """Get an itinerary job's status, and its itinerary once it has succeeded"""
+    job = await get_job(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(job_document_to_response(job))
+
+@app.get("/itinerary/cache/stats")
+async def itinerary_cache_stats():
+    """Hit/miss counters for the itinerary cache"""
+    return get_cache_stats()
+
+@app.get("/itinerary/tokens/stats")
+async def itinerary_token_stats():
+    """Estimated and billed prompt tokens, including provider-cached prefix tokens"""
+    return get_prompt_token_stats(OPENAI_MODEL)
+
+def trip_etag(trip: dict) -> str:
+    return f'"{trip.get("version", 0)}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Return the trip version named by an If-Match header, if any"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+def version_filter(version: int):
+    # Trips written before versioning have no version field and count as version 0
+    return {"$in": [0, None]} if version == 0 else version
+
+def trip_document_to_response(trip: dict) -> dict:
+    """Rename a trips document's _id for the response; orjson stringifies the ObjectIds"""
+    trip["id"] = trip.pop("_id")
+    return trip
+
+@app.post("/trips", response_model=TripResponse)
 async def create_trip(
     trip_data: TripCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Database = Depends(get_database)
+    trips: TripRepository = Depends(get_trips)
 ):
     """Create a new trip for the authenticated user"""
     trip_dict = trip_data.dict()
     trip_dict["user_id"] = current_user.id
+    trip_dict["created_at"] = trip_dict["updated_at"] = datetime.utcnow()
+    trip_dict["version"] = 1
     
-    result = db.trips.insert_one(trip_dict)
-    trip_dict["_id"] = result.inserted_id
-    
-    # Convert ObjectId to string for JSON response
-    trip_dict["id"] = str(trip_dict["_id"])
-    del trip_dict["_id"]
-    trip_dict["user_id"] = str(trip_dict["user_id"])
-    
-    return trip_dict
+    await trips.create(trip_dict)
+    return FastJSONResponse(
+        trip_document_to_response(trip_dict), headers={"ETag": trip_etag(trip_dict)}
+    )
 
-@app.get("/trips", response_model=list)
+@app.get("/trips", response_model=List[TripResponse])
 async def get_user_trips(
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_TRIPS_PAGE_SIZE),
+    view: Literal["summary", "full"] = "full",
+    format: Literal["json", "ndjson"] = "json",
     current_user: User = Depends(get_current_active_user),
-    db: Database = Depends(get_database)
+    trips: TripRepository = Depends(get_trips)
 ):
-    """Get all trips for the authenticated user"""
-    trips = list(db.trips.find({"user_id": current_user.id}))
-    
-    # Convert ObjectIds to strings
-    for trip in trips:
-        trip["id"] = str(trip["_id"])
-        del trip["_id"]
-        trip["user_id"] = str(trip["user_id"])
-    
-    return trips
+    """
+    Get the authenticated user's trips, newest first.
+
+    Without `limit` or `cursor` every trip is returned. With either, JSON
+    responses are paginated: pass the X-Next-Cursor response header back as
+    `cursor` to fetch the next page. `view=summary` leaves out the embedded
+    itinerary, flights and expenses. `format=ndjson` streams every remaining
+    trip (or `limit` of them) one per line.
+    """
+    before = None
+    if cursor is not None:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        before = ObjectId(cursor)
+    projection = TRIP_SUMMARY_PROJECTION if view == "summary" else None
+
+    if format == "ndjson":
+        trips_cursor = trips.find_for_user(current_user.id, before, projection)
+        if limit is not None:
+            trips_cursor = trips_cursor.limit(limit)
+
+        async def ndjson_lines():
+            async for trip in trips_cursor.batch_size(TRIPS_STREAM_BATCH_SIZE):
+                yield dumps(trip_document_to_response(trip)) + b"\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-@app.put("/trips/{trip_id}", response_model=dict)
+    if limit is None and before is None:
+        page = await trips.list_for_user(current_user.id, projection=projection)
+        return FastJSONResponse([trip_document_to_response(trip) for trip in page])
+
+    page_size = limit or DEFAULT_TRIPS_PAGE_SIZE
+    page = await trips.list_for_user(current_user.id, page_size + 1, before, projection)
+    headers = {}
+    if len(page) > page_size:
+        page = page[:page_size]
+        headers["X-Next-Cursor"] = str(page[-1]["_id"])
+    return FastJSONResponse([trip_document_to_response(trip) for trip in page], headers=headers)
+
+@app.put("/trips/{trip_id}", response_model=TripResponse)
 async def update_trip(
     trip_id: str,
-    trip_updates: dict,
+    trip_updates: TripUpdate,
+    if_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
-    db: Database = Depends(get_database)
+    trips: TripRepository = Depends(get_trips)
 ):
-    """Update a trip for the authenticated user"""
+    """
+    Update a trip for the authenticated user in a single round trip.
+
+    Send the trip's ETag in If-Match to reject the update with 412 if someone
+    else changed the trip in the meantime.
+    """
     if not ObjectId.is_valid(trip_id):
         raise HTTPException(status_code=400, detail="Invalid trip ID")
-    
-    # Check if trip exists and belongs to user
-    trip = db.trips.find_one({"_id": ObjectId(trip_id), "user_id": current_user.id})
-    if not trip:
+    expected_version = parse_if_match(if_match)
+
+    updates = trip_updates.model_dump(exclude_unset=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="No changes made")
+    updates["updated_at"] = datetime.utcnow()
+
+    # Ownership (and the version precondition) are part of the filter
+    trip_filter = {"_id": ObjectId(trip_id), "user_id": current_user.id}
+    if expected_version is not None:
+        trip_filter["version"] = version_filter(expected_version)
+    updated_trip = await trips.update(trip_filter, {"$set": updates, "$inc": {"version": 1}})
+    if updated_trip is None:
+        if expected_version is not None and await trips.exists(
+            {"_id": ObjectId(trip_id), "user_id": current_user.id}
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Trip was modified by another request"
+            )
         raise HTTPException(status_code=404, detail="Trip not found")
-    
-    # Update trip
-    result = db.trips.update_one(
-        {"_id": ObjectId(trip_id)},
-        {"$set": trip_updates}
+
+    return FastJSONResponse(
+        trip_document_to_response(updated_trip), headers={"ETag": trip_etag(updated_trip)}
     )
-    
-    if result.modified_count == 0:
+
+def owned_trip_filter(trip_id: str, current_user: User) -> dict:
+    if not ObjectId.is_valid(trip_id):
+        raise HTTPException(status_code=400, detail="Invalid trip ID")
+    return {"_id": ObjectId(trip_id), "user_id": current_user.id}
+
+async def raise_trip_write_failed(
+    trips: TripRepository, trip_filter: dict, expected_version: Optional[int], item_id: Optional[str] = None,
+    added_id: Optional[str] = None
+):
+    """
+    Turn an unmatched conditional write into 404 or 412, or 409 when the id
+    of an added item is already taken
+    """
+    if not await trips.exists(trip_filter):
+        raise HTTPException(status_code=404, detail="Trip not found")
+    if expected_version is not None and not await trips.exists(
+        {**trip_filter, "version": version_filter(expected_version)}
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Trip was modified by another request"
+        )
+    if added_id is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Item {added_id} already exists")
+    raise HTTPException(status_code=404, detail=f"Item {item_id} not found")
+
+def validate_item_fields(collection: TripCollection, fields: Optional[dict]) -> dict:
+    """Check the fields of an item patch; itinerary items are typed"""
+    if not fields:
         raise HTTPException(status_code=400, detail="No changes made")
-    
-    # Return updated trip
-    updated_trip = db.trips.find_one({"_id": ObjectId(trip_id)})
-    updated_trip["id"] = str(updated_trip["_id"])
-    del updated_trip["_id"]
-    updated_trip["user_id"] = str(updated_trip["user_id"])
-    
-    return updated_trip
+    if collection == TripCollection.itinerary:
+        try:
+            changes = ItineraryItemUpdate(**fields).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        if not changes:
+            raise HTTPException(status_code=400, detail="No changes made")
+        return changes
+    for key in fields:
+        if not key or key == "id" or key.startswith("$") or "." in key:
+            raise HTTPException(status_code=400, detail=f"Invalid field name: {key}")
+    return fields
+
+def prepare_new_item(collection: TripCollection, item: Optional[dict]) -> dict:
+    """Validate an item to append and make sure it has a string id"""
+    if not item:
+        raise HTTPException(status_code=400, detail="Item is required")
+    item = dict(item)
+    item["id"] = str(item.get("id") or ObjectId())
+    if collection == TripCollection.itinerary:
+        try:
+            return ItineraryItem(**item).model_dump()
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+    return item
+
+def item_write(update: dict) -> dict:
+    """Add the version bump and timestamp every trip write carries"""
+    update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+    update["$inc"] = {"version": 1}
+    return update
+
+# Trip fields an itinerary is planned from
+TRIP_PLAN_FIELDS = ("destination", "start_date", "end_date", "budget", "currency", "travelers", "preferences")
+
+@app.post("/trips/{trip_id}/itinerary/regenerate", response_model=dict)
+async def regenerate_trip_days(
+    trip_id: str,
+    regenerate: ItineraryRegenerateRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    trips: TripRepository = Depends(get_trips)
+):
+    """
+    Replan only the given days of a trip's itinerary, keeping the other days
+    and completed items. Replaced items keep their ids.
+    """
+    trip_filter = owned_trip_filter(trip_id, current_user)
+    expected_version = parse_if_match(if_match)
+    trip = await trips.find_one(trip_filter, {**{field: 1 for field in TRIP_PLAN_FIELDS}, "itinerary": 1, "version": 1})
+    if trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    read_version = trip.get("version", 0)
+    if expected_version is not None and expected_version != read_version:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Trip was modified by another request"
+        )
+
+    request = ItineraryRequest(
+        destination=trip.get("destination") or "",
+        start_date=trip.get("start_date") or "",
+        end_date=trip.get("end_date") or "",
+        budget=trip.get("budget") or 0,
+        currency=trip.get("currency") or "",
+        travelers=trip.get("travelers") or 1,
+        preferences=trip.get("preferences") or []
+    )
+    new_items, replaced_ids, days = await regenerate_itinerary_days(
+        request, trip.get("itinerary") or [], regenerate.days, regenerate.feedback
+    )
+
+    # Only the regenerated days' items change; the write fails if the trip changed while the model ran
+    updated = await trips.replace_items(
+        {**trip_filter, "version": version_filter(read_version)}, "itinerary", replaced_ids, new_items,
+        projection={"version": 1}
+    )
+    if updated is None:
+        await raise_trip_write_failed(trips, trip_filter, read_version)
+    response.headers["ETag"] = trip_etag(updated)
+    return {"days": days, "items": new_items, "version": updated["version"]}
+
+@app.post("/trips/{trip_id}/{collection}", response_model=dict)
+async def add_trip_item(
+    trip_id: str,
+    collection: TripCollection,
+    item: dict,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    trips: TripRepository = Depends(get_trips)
+):
+    """Append one item to a trip's itinerary, flights or expenses"""
+    trip_filter = owned_trip_filter(trip_id, current_user)
+    expected_version = parse_if_match(if_match)
+    new_item = prepare_new_item(collection, item)
+
+    # Item ids must stay unique for the positional updates to hit the right element
+    query = {**trip_filter, f"{collection.value}.id": {"$ne": new_item["id"]}}
+    if expected_version is not None:
+        query["version"] = version_filter(expected_version)
+    updated = await trips.update(
+        query, item_write({"$push": {collection.value: new_item}}), projection={"version": 1}
+    )
+    if updated is None:
+        await raise_trip_write_failed(trips, trip_filter, expected_version, added_id=new_item["id"])
+    response.headers["ETag"] = trip_etag(updated)
+    return {"item": new_item, "version": updated["version"]}
+
+@app.patch("/trips/{trip_id}/{collection}/{item_id}", response_model=dict)
+async def update_trip_item(
+    trip_id: str,
+    collection: TripCollection,
+    item_id: str,
+    fields: dict,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    trips: TripRepository = Depends(get_trips)
+):
+    """Change fields of one item (e.g. mark an itinerary item completed)"""
+    trip_filter = owned_trip_filter(trip_id, current_user)
+    expected_version = parse_if_match(if_match)
+    changes = validate_item_fields(collection, fields)
+
+    # The positional operator targets the element matched by the filter
+    query = {**trip_filter, f"{collection.value}.id": item_id}
+    if expected_version is not None:
+        query["version"] = version_filter(expected_version)
+    updated = await trips.update(
+        query,
+        item_write({"$set": {f"{collection.value}.$.{key}": value for key, value in changes.items()}}),
+        projection={"version": 1, collection.value: {"$elemMatch": {"id": item_id}}}
+    )
+    if updated is None:
+        await raise_trip_write_failed(trips, trip_filter, expected_version, item_id)
+    response.headers["ETag"] = trip_etag(updated)
+    items = updated.get(collection.value) or [None]
+    return {"item": items[0], "version": updated["version"]}
+
+@app.delete("/trips/{trip_id}/{collection}/{item_id}", response_model=dict)
+async def remove_trip_item(
+    trip_id: str,
+    collection: TripCollection,
+    item_id: str,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    trips: TripRepository = Depends(get_trips)
+):
+    """Remove one item from a trip's itinerary, flights or expenses"""
+    trip_filter = owned_trip_filter(trip_id, current_user)
+    expected_version = parse_if_match(if_match)
+
+    query = {**trip_filter, f"{collection.value}.id": item_id}
+    if expected_version is not None:
+        query["version"] = version_filter(expected_version)
+    updated = await trips.update(
+        query, item_write({"$pull": {collection.value: {"id": item_id}}}), projection={"version": 1}
+    )
+    if updated is None:
+        await raise_trip_write_failed(trips, trip_filter, expected_version, item_id)
+    response.headers["ETag"] = trip_etag(updated)
+    return {"id": item_id, "version": updated["version"]}
+
+@app.post("/trips/{trip_id}/{collection}/batch", response_model=dict)
+async def batch_trip_items(
+    trip_id: str,
+    collection: TripCollection,
+    batch: TripItemBatch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    trips: TripRepository = Depends(get_trips)
+):
+    """
+    Apply many add/patch/remove operations to one embedded array, all or
+    nothing. Patches and removals of unknown ids change nothing, and a batch
+    that changes nothing leaves the version alone.
+
+    The operations are applied in order to the stored array, which is written
+    back in one update conditioned on the version it was read at: a
+    concurrent change (or a stale If-Match) gives 412 and an add whose id is
+    taken gives 409, with no operation applied.
+    """
+    trip_filter = owned_trip_filter(trip_id, current_user)
+    expected_version = parse_if_match(if_match)
+    field = collection.value
+    trip = await trips.find_one(trip_filter, {field: 1, "version": 1})
+    if trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    read_version = trip.get("version", 0)
+    if expected_version is not None and expected_version != read_version:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Trip was modified by another request"
+        )
+
+    items = list(trip.get(field) or [])
+    changed = False
+    for index, operation in enumerate(batch.operations):
+        if operation.op == "add":
+            new_item = prepare_new_item(collection, operation.item)
+            if any(item.get("id") == new_item["id"] for item in items):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Operation {index} adds an item whose id already exists; no operations applied",
+                    headers={"ETag": trip_etag(trip)}
+                )
+            items.append(new_item)
+            changed = True
+        elif not operation.id:
+            raise HTTPException(status_code=400, detail=f"Operation {index} needs an id")
+        elif operation.op == "patch":
+            changes = validate_item_fields(collection, operation.fields)
+            for position, item in enumerate(items):
+                if item.get("id") == operation.id:
+                    items[position] = {**item, **changes}
+                    changed = True
+        else:
+            remaining = [item for item in items if item.get("id") != operation.id]
+            changed = changed or len(remaining) < len(items)
+            items = remaining
+
+    if not changed:
+        response.headers["ETag"] = trip_etag(trip)
+        return {"applied": len(batch.operations), "version": read_version}
+    updated = await trips.update(
+        {**trip_filter, "version": version_filter(read_version)},
+        item_write({"$set": {field: items}}),
+        projection={"version": 1}
+    )
+    if updated is None:
+        await raise_trip_write_failed(trips, trip_filter, read_version)
+    response.headers["ETag"] = trip_etag(updated)
+    return {"applied": len(batch.operations), "version": updated["version"]}
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Sequence, Tuple
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv()
+
+# Off by default; when disabled every timer is a shared no-op context manager
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP = nullcontext()
+
+
+def _format_labels(labelnames: Sequence[str], labels: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total[0]) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[-1]
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series_labels = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{series_labels} {total}")
+            lines.append(f"{self.name}_count{series_labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter in the Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+registry: List = []
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status")
+)
+stage_duration = Histogram(
+    "stage_duration_seconds",
+    "Time spent in hot-path stages (jwt_decode, user_lookup, bcrypt_hash, bcrypt_verify, "
+    "llm_queue_wait, llm_call, llm_stream, json_parse, model_construction)",
+    ("stage",)
+)
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trips by command", ("command",)
+)
+llm_tokens = Counter(
+    "llm_tokens_total",
+    "LLM tokens by kind (estimated_prompt, prompt, cached_prompt, completion) and backend",
+    ("kind", "backend")
+)
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_duration.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+def timed(stage: str):
+    """Context manager recording the duration of a stage; a no-op when metrics are disabled"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _StageTimer(stage)
+
+
+def record_tokens(backend: str, estimated_prompt: int, usage=None):
+    """Count one completion's estimated and reported token usage"""
+    if not METRICS_ENABLED:
+        return
+    llm_tokens.inc(estimated_prompt, "estimated_prompt", backend)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    llm_tokens.inc(usage.prompt_tokens or 0, "prompt", backend)
+    llm_tokens.inc(getattr(details, "cached_tokens", None) or 0, "cached_prompt", backend)
+    llm_tokens.inc(usage.completion_tokens or 0, "completion", backend)
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """Feeds MongoDB command durations into mongo_command_duration_seconds"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,22 +1,25 @@
-from pydantic import BaseModel, EmailStr, Field, GetCoreSchemaHandler
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, GetCoreSchemaHandler, field_validator, model_validator
+from typing import Optional, List, Literal
+from enum import Enum
 from datetime import datetime
 from bson import ObjectId
-from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
 
 
 class PyObjectId(ObjectId):
     @classmethod
     def __get_pydantic_core_schema__(cls, source, handler: GetCoreSchemaHandler):
-        from pydantic_core import core_schema
-        return core_schema.no_info_after_validator_function(
+        # Accepts ObjectIds straight from Mongo documents as well as strings,
+        # and serializes to a string in JSON mode
+        return core_schema.no_info_plain_validator_function(
             cls.validate,
-            core_schema.str_schema(),
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json"),
         )
 
     @classmethod
     def validate(cls, v):
+        if isinstance(v, ObjectId):
+            return v
         if not ObjectId.is_valid(v):
             raise ValueError("Invalid ObjectId")
         return ObjectId(v)
@@ -86,19 +89,65 @@ class Trip(BaseModel):
     expenses: Optional[List[dict]] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Incremented on every write; exposed as the trip's ETag
+    version: int = 0
 
     class Config:
         validate_by_name = True
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+class TripResponse(BaseModel):
+    """A trip as returned by the API; the embedded arrays are absent in summary listings"""
+    id: PyObjectId
+    user_id: PyObjectId
+    destination: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    budget: float
+    currency: str
+    travelers: int
+    preferences: List[str] = []
+    itinerary: Optional[List[dict]] = None
+    flights: Optional[List[dict]] = None
+    expenses: Optional[List[dict]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: int = 0
+
 class TripUpdate(BaseModel):
+    destination: Optional[str] = None
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     budget: Optional[float] = None
     currency: Optional[str] = None
     travelers: Optional[int] = None
     preferences: Optional[List[str]] = None
+    itinerary: Optional[List[dict]] = None
+    flights: Optional[List[dict]] = None
+    expenses: Optional[List[dict]] = None
+
+class TripCollection(str, Enum):
+    """Embedded arrays of a trip that support item-level operations"""
+    itinerary = "itinerary"
+    flights = "flights"
+    expenses = "expenses"
+
+class TripItemOperation(BaseModel):
+    op: Literal["add", "patch", "remove"]
+    id: Optional[str] = None
+    # Full item for "add"
+    item: Optional[dict] = None
+    # Fields to change for "patch"
+    fields: Optional[dict] = None
+
+class TripItemBatch(BaseModel):
+    operations: List[TripItemOperation] = Field(..., min_length=1, max_length=500)
+
+class ItineraryRegenerateRequest(BaseModel):
+    days: List[int] = Field(..., min_length=1, max_length=60)
+    # Optional note on what to change, e.g. "fewer museums"
+    feedback: Optional[str] = Field(None, max_length=500)
 
 class ItineraryRequest(BaseModel):
     destination: str
@@ -108,6 +157,8 @@ class ItineraryRequest(BaseModel):
     currency: str
     travelers: int
     preferences: List[str]
+    # LLM backend override ("openai", "replay", "rules"); must be allowed by LLM_BACKEND_OVERRIDES
+    backend: Optional[str] = None
 
 class ItineraryItem(BaseModel):
     id: str
@@ -122,5 +173,130 @@ class ItineraryItem(BaseModel):
     rating: float
     completed: bool = False
 
+# Day/expenses payload the model is asked for in structured-output mode. Strict
+# JSON schemas need every field required and no additional properties.
+ItineraryCategory = Literal[
+    "food", "activities", "transportation", "accommodation",
+    "shopping", "entertainment", "health", "other"
+]
+
+class ItineraryActivity(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    name: str
+    description: str
+    cost: float
+    time: str
+    category: ItineraryCategory
+
+class ItineraryDayExpenses(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    food: List[ItineraryActivity]
+    activities: List[ItineraryActivity]
+    transportation: List[ItineraryActivity]
+    accommodation: List[ItineraryActivity]
+    shopping: List[ItineraryActivity]
+    entertainment: List[ItineraryActivity]
+    health: List[ItineraryActivity]
+    other: List[ItineraryActivity]
+
+class ItineraryDay(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    day: int
+    expenses: ItineraryDayExpenses
+
+class ItineraryPlan(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    days: List[ItineraryDay]
+
 class ItineraryResponse(BaseModel):
-    itinerary: List[ItineraryItem]
\ No newline at end of file
+    itinerary: List[ItineraryItem]
+
+class ItineraryBatchRequest(BaseModel):
+    requests: List[ItineraryRequest] = Field(..., min_length=1, max_length=100)
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
+class ItineraryBatchResult(BaseModel):
+    index: int
+    itinerary: Optional[List[ItineraryItem]] = None
+    error: Optional[str] = None
+
+class ItineraryBatchResponse(BaseModel):
+    results: List[ItineraryBatchResult]
+
+class ItineraryJob(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+    itinerary: Optional[List[ItineraryItem]] = None
+    error: Optional[str] = None
+
+CLOCK_TIME_PATTERN = r"^(?:(?:[01]?\d|2[0-3]):[0-5]\d|24:00)$"
+
+def clock_minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+class BudgetFitRequest(BaseModel):
+    itinerary: List[ItineraryItem]
+    # The whole party's budget; item costs are per traveler
+    budget: float = Field(..., gt=0)
+    travelers: int = Field(1, ge=1)
+    # Daily time window as HH:MM (24:00 for midnight); server defaults when omitted
+    day_start: Optional[str] = Field(None, pattern=CLOCK_TIME_PATTERN)
+    day_end: Optional[str] = Field(None, pattern=CLOCK_TIME_PATTERN)
+    min_food_per_day: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def check_window(self):
+        if self.day_start and self.day_end and clock_minutes(self.day_end) <= clock_minutes(self.day_start):
+            raise ValueError("day_end must be later than day_start")
+        return self
+
+class BudgetDayReport(BaseModel):
+    day: int
+    cost: float
+    minutes: int
+    available_minutes: int
+    food_items: int
+
+class BudgetFitReport(BaseModel):
+    feasible: bool
+    budget: float
+    original_cost: float
+    total_cost: float
+    dropped_ids: List[str] = []
+    issues: List[str] = []
+    days: List[BudgetDayReport] = []
+
+class BudgetFitResponse(BaseModel):
+    itinerary: List[ItineraryItem]
+    report: BudgetFitReport
+
+class ItineraryItemUpdate(BaseModel):
+    # Unknown fields are an error rather than a silent no-op that bumps the version
+    model_config = ConfigDict(extra="forbid")
+
+    day: Optional[int] = None
+    time: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    location: Optional[str] = None
+    type: Optional[str] = None
+    duration: Optional[str] = None
+    cost: Optional[float] = None
+    rating: Optional[float] = None
+    completed: Optional[bool] = None
+
+    @field_validator("*")
+    @classmethod
+    def reject_null(cls, value):
+        # Omitted fields are left alone; an explicit null would break the stored item
+        if value is None:
+            raise ValueError("may not be null")
+        return value
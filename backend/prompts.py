@@ -0,0 +1,263 @@
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from metrics import record_tokens
+from models import ItineraryRequest
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to an estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Everything below is identical for every request and frozen at import, so it
+# can sit at the start of the conversation where provider-side prompt caching
+# reuses it. Only build_user_prompt() varies per request.
+ROLE_INSTRUCTIONS = "You are an expert travel planner with deep knowledge of destinations worldwide. Generate detailed, personalized itineraries in JSON format only. Always consider budget constraints, traveler preferences, and realistic timing."
+
+ITINERARY_INSTRUCTIONS = (
+    "For each activity/expense, use one of these categories: 'food', 'activities', 'transportation', 'accommodation', 'shopping', 'entertainment', 'health', 'other'."
+    "\nExamples:"
+    "\n- 'Lunch at Bistro' → category: 'food'"
+    "\n- 'Wine tasting tour' → category: 'food'"
+    "\n- 'Visit the Louvre' → category: 'activities'"
+    "\n- 'Metro ticket' → category: 'transportation'"
+    "\n- 'Hotel check-in' → category: 'accommodation'"
+    "\n- 'Buy souvenirs' → category: 'shopping'"
+    "\n- 'Concert ticket' → category: 'entertainment'"
+    "\n- 'Pharmacy purchase' → category: 'health'"
+    "\nIf unsure, use the closest matching category."
+    "\nPlease return the itinerary as a JSON array. Each element should be an object with: 'day' (integer), and 'expenses' (an object with keys as categories like 'food', 'activities', 'transportation', etc., and values as lists of activities/expenses for that category)."
+    "\nEach activity/expense should have: 'name', 'description', 'cost', 'time', and 'category'."
+    "\nExample:\n"
+    '[\n'
+    '  {"day": 1, "expenses": {\n'
+    '    "food": [\n'
+    '      {"name": "Lunch at Bistro", "description": "French cuisine", "cost": 25.0, "time": "12:00", "category": "food"}\n'
+    '    ],\n'
+    '    "activities": [\n'
+    '      {"name": "Louvre Visit", "description": "Art museum", "cost": 17.0, "time": "09:00", "category": "activities"}\n'
+    '    ],\n'
+    '    "transportation": [\n'
+    '      {"name": "Metro Ticket", "description": "Subway ride", "cost": 2.5, "time": "08:30", "category": "transportation"}\n'
+    '    ]\n'
+    '  }},\n'
+    '  {"day": 2, "expenses": {\n'
+    '    "food": [\n'
+    '      {"name": "Breakfast at Cafe", "description": "Coffee and croissant", "cost": 8.0, "time": "08:00", "category": "food"}\n'
+    '    ],\n'
+    '    "activities": [\n'
+    '      {"name": "Eiffel Tower", "description": "Landmark visit", "cost": 20.0, "time": "10:00", "category": "activities"}\n'
+    '    ]\n'
+    '  }}\n'
+    ']'
+)
+
+# Object response formats cannot return a bare array
+OBJECT_RESPONSE_INSTRUCTION = '\nWrap the array in a JSON object: {"days": [...]}.'
+
+SYSTEM_PROMPT = f"{ROLE_INSTRUCTIONS}\n\n{ITINERARY_INSTRUCTIONS}"
+OBJECT_SYSTEM_PROMPT = SYSTEM_PROMPT + OBJECT_RESPONSE_INSTRUCTION
+
+# Chat formatting overhead per message and per reply, as documented for OpenAI chat models
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+def system_prompt(object_response: bool = False) -> str:
+    """The frozen instruction prefix for the configured response format"""
+    return OBJECT_SYSTEM_PROMPT if object_response else SYSTEM_PROMPT
+
+
+def build_user_prompt(request: ItineraryRequest, num_days: int, has_dates: bool) -> str:
+    """
+    The per-request part of the prompt: trip length, budget, destination,
+    dates and interests
+    """
+    parts = [
+        f"Generate a {num_days}-day itinerary for me. My budget is {request.budget} {request.currency}.",
+        f"I am travelling to {request.destination} with {request.travelers} traveler(s).",
+    ]
+    if has_dates:
+        parts.append(f"My trip is from {request.start_date} to {request.end_date}.")
+    if request.preferences:
+        parts.append(f"My interests are: {', '.join(request.preferences)}.")
+    return " ".join(parts)
+
+
+def build_repair_prompt(
+    request: ItineraryRequest, num_days: int, has_dates: bool,
+    missing_days: List[int], planned_names: List[str]
+) -> str:
+    """User prompt asking for only the days missing from an earlier completion"""
+    prompt = build_user_prompt(request, num_days, has_dates)
+    prompt += f"\nOnly return days {', '.join(str(day) for day in missing_days)}; the other days are already planned."
+    if planned_names:
+        prompt += f" Do not repeat these activities: {'; '.join(planned_names)}."
+    return prompt
+
+
+def build_trip_outline(
+    request: ItineraryRequest, chunks: List[Tuple[int, int]], has_dates: bool, current: int
+) -> str:
+    """
+    One line per chunk of a long trip with its days, dates and focus, so that
+    chunks generated in parallel split the destination between them
+    """
+    start_date = datetime.strptime(request.start_date, "%Y-%m-%d") if has_dates else None
+    lines = []
+    for index, (first_day, last_day) in enumerate(chunks):
+        line = f"- Days {first_day}-{last_day}"
+        if start_date is not None:
+            first = start_date + timedelta(days=first_day - 1)
+            last = start_date + timedelta(days=last_day - 1)
+            line += f" ({first:%Y-%m-%d} to {last:%Y-%m-%d})"
+        focus = []
+        if index == 0:
+            focus.append("arrival")
+        if request.preferences:
+            focus.append(request.preferences[index % len(request.preferences)])
+        else:
+            focus.append(f"part {index + 1} of {len(chunks)} of {request.destination}'s sights")
+        if index == len(chunks) - 1:
+            focus.append("departure")
+        line += ": " + ", ".join(focus)
+        if index == current:
+            line += " (your part)"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def build_chunk_prompt(
+    request: ItineraryRequest, num_days: int, has_dates: bool,
+    chunks: List[Tuple[int, int]], current: int, budget_share: float
+) -> str:
+    """User prompt for one chunk of a long trip that is generated in parallel parts"""
+    first_day, last_day = chunks[current]
+    parts = [
+        f"Generate days {first_day} to {last_day} of a {num_days}-day itinerary for me.",
+        f"My budget for these {last_day - first_day + 1} days is {budget_share:.2f} {request.currency}"
+        f" (the whole trip's budget is {request.budget} {request.currency}).",
+        f"I am travelling to {request.destination} with {request.travelers} traveler(s).",
+    ]
+    if request.preferences:
+        parts.append(f"My interests are: {', '.join(request.preferences)}.")
+    prompt = " ".join(parts)
+    prompt += "\nThe trip is planned in parts:\n" + build_trip_outline(request, chunks, has_dates, current)
+    prompt += (
+        f"\nOnly return days {first_day} to {last_day}, numbered as such,"
+        " and leave sights that suit another part's focus to that part."
+    )
+    return prompt
+
+
+def build_regenerate_prompt(
+    request: ItineraryRequest, num_days: int, has_dates: bool, days: List[int], budget_left: float,
+    kept_names: List[str], replaced_names: List[str], feedback: Optional[str] = None
+) -> str:
+    """User prompt replanning some days of an existing itinerary around the days that stay"""
+    kept_names = [name for name in kept_names if name]
+    replaced_names = [name for name in replaced_names if name]
+    prompt = build_user_prompt(request, num_days, has_dates)
+    prompt += (
+        f"\nThe rest of the trip is already planned. Only return days {', '.join(str(day) for day in days)},"
+        f" with a budget of {budget_left:.2f} {request.currency} for them."
+    )
+    if kept_names:
+        prompt += f" Do not repeat these activities: {'; '.join(kept_names)}."
+    if replaced_names:
+        prompt += f" Suggest something different from the current plan for these days: {'; '.join(replaced_names)}."
+    if feedback:
+        prompt += f" The traveler's feedback on these days: {feedback.strip()}"
+    return prompt
+
+
+def build_messages(user_prompt: str, object_response: bool = False) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt(object_response)},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=4)
+def _count_static_tokens(text: str, model: str) -> int:
+    return count_tokens(text, model)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Token count of text using tiktoken when installed, otherwise the usual
+    four-characters-per-token estimate
+    """
+    if tiktoken is not None and model:
+        return len(_encoding(model).encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """Estimated prompt tokens for a chat request; the system prefix is counted once per model"""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        content = message["content"]
+        if message["role"] == "system":
+            total += _count_static_tokens(content, model)
+        else:
+            total += count_tokens(content, model)
+        total += TOKENS_PER_MESSAGE
+    return total
+
+
+class PromptTokenStats:
+    requests: int = 0
+    estimated_prompt_tokens: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+prompt_token_stats = PromptTokenStats()
+
+
+def record_token_usage(estimated_prompt_tokens: int, usage, backend: str = "openai") -> None:
+    """
+    Log one completion's estimated and reported token usage, tagged with the
+    request ID, and add it to the running totals and metrics. usage may be
+    None when the provider did not report it.
+    """
+    prompt_token_stats.requests += 1
+    prompt_token_stats.estimated_prompt_tokens += estimated_prompt_tokens
+    record_tokens(backend, estimated_prompt_tokens, usage)
+    counts = {"backend": backend, "estimated_prompt_tokens": estimated_prompt_tokens}
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        counts["prompt_tokens"] = usage.prompt_tokens or 0
+        counts["cached_prompt_tokens"] = getattr(details, "cached_tokens", None) or 0
+        counts["completion_tokens"] = usage.completion_tokens or 0
+        prompt_token_stats.prompt_tokens += counts["prompt_tokens"]
+        prompt_token_stats.cached_prompt_tokens += counts["cached_prompt_tokens"]
+        prompt_token_stats.completion_tokens += counts["completion_tokens"]
+    logger.info("LLM token usage", extra=counts)
+
+
+def get_prompt_token_stats(model: Optional[str] = None) -> dict:
+    requests = prompt_token_stats.requests
+    return {
+        "requests": requests,
+        "system_prompt_tokens": _count_static_tokens(SYSTEM_PROMPT, model),
+        "estimated_prompt_tokens": prompt_token_stats.estimated_prompt_tokens,
+        "prompt_tokens": prompt_token_stats.prompt_tokens,
+        "cached_prompt_tokens": prompt_token_stats.cached_prompt_tokens,
+        "completion_tokens": prompt_token_stats.completion_tokens,
+        "avg_prompt_tokens": prompt_token_stats.prompt_tokens / requests if requests else 0.0,
+    }
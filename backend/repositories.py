@@ -0,0 +1,110 @@
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.cursor import AsyncCursor
+
+from models import User
+
+
+class UserRepository:
+    """Queries on the users collection"""
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def find_by_email(self, email: str) -> Optional[User]:
+        user_data = await self.collection.find_one({"email": email})
+        if user_data is None:
+            return None
+        user_data["_id"] = str(user_data["_id"])
+        return User(**user_data)
+
+    async def email_exists(self, email: str) -> bool:
+        return await self.collection.find_one({"email": email}, {"_id": 1}) is not None
+
+    async def create(self, email: str, full_name: str, hashed_password: str) -> User:
+        user_data = {
+            "email": email,
+            "full_name": full_name,
+            "hashed_password": hashed_password,
+            "is_active": True
+        }
+        result = await self.collection.insert_one(user_data)
+        user_data["_id"] = str(result.inserted_id)
+        return User(**user_data)
+
+    async def set_password_hash(self, user_id: ObjectId, hashed_password: str):
+        await self.collection.update_one({"_id": user_id}, {"$set": {"hashed_password": hashed_password}})
+
+
+class TripRepository:
+    """Queries on the trips collection; every read and write is scoped by the caller's filter"""
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def create(self, trip: dict) -> dict:
+        """Insert a trip document and return it with its _id"""
+        result = await self.collection.insert_one(trip)
+        trip["_id"] = result.inserted_id
+        return trip
+
+    def find_for_user(
+        self, user_id: ObjectId, before: Optional[ObjectId] = None, projection: Optional[dict] = None
+    ) -> AsyncCursor:
+        """A user's trips, newest first, optionally only those older than the before id"""
+        query = {"user_id": user_id}
+        if before is not None:
+            # Keyset pagination: ObjectIds increase with insertion time
+            query["_id"] = {"$lt": before}
+        return self.collection.find(query, projection).sort("_id", -1)
+
+    async def list_for_user(
+        self, user_id: ObjectId, limit: Optional[int] = None, before: Optional[ObjectId] = None,
+        projection: Optional[dict] = None
+    ) -> List[dict]:
+        cursor = self.find_for_user(user_id, before, projection)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list()
+
+    async def update(self, query: dict, update: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        """Apply update to the trip matching query and return the new document, or None"""
+        return await self.collection.find_one_and_update(
+            query, update, projection=projection, return_document=ReturnDocument.AFTER
+        )
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one(query, projection)
+
+    async def replace_items(
+        self, query: dict, field: str, remove_ids: List[str], items: List[dict], projection: Optional[dict] = None
+    ) -> Optional[dict]:
+        """
+        In one update, swap the elements of an embedded array whose id is in
+        remove_ids for items, leaving every other element as stored, and bump
+        the version. Returns the new document, or None if query matched nothing.
+        """
+        return await self.collection.find_one_and_update(
+            query,
+            [{"$set": {
+                field: {"$concatArrays": [
+                    {"$filter": {
+                        "input": {"$ifNull": [f"${field}", []]},
+                        "cond": {"$not": {"$in": ["$$this.id", remove_ids]}},
+                    }},
+                    # Item values starting with "$" must not be read as field paths
+                    {"$literal": items},
+                ]},
+                "updated_at": datetime.utcnow(),
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            }}],
+            projection=projection,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def exists(self, query: dict) -> bool:
+        return await self.collection.count_documents(query, limit=1) > 0
@@ -0,0 +1,34 @@
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel
+
+
+def json_default(value: Any):
+    """orjson fallback for the BSON types stored in our documents"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson-rendered JSON response that also serializes ObjectIds.
+
+    Return it directly from a handler with a raw Mongo document to skip
+    FastAPI's jsonable_encoder pass and response_model re-validation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_model_response(model: BaseModel, **kwargs) -> Response:
+    """Serialize an already-validated model with pydantic's own JSON encoder"""
+    return Response(model.model_dump_json(), media_type="application/json", **kwargs)
@@ -1,29 +1,100 @@
-import uvicorn
+"""
+Start the Travel Planner API.
+
+    python run.py                # development: one process with auto-reload
+    python run.py --production   # WEB_CONCURRENCY workers, no file watcher
+
+Production mode uses uvloop and httptools when they are installed, recycles
+each worker after WORKER_MAX_REQUESTS requests (with more than one worker),
+and on SIGTERM stops
+accepting connections and gives in-flight requests (including LLM calls)
+GRACEFUL_SHUTDOWN_SECONDS to finish.
+"""
+import argparse
+import importlib.util
+import logging
 import os
-import ssl
-from main import app  # Import from backend/main.py
 
-if __name__ == "__main__":
-    cert_dir = os.path.join(os.path.dirname(__file__), 'certs')
-    cert_path = os.path.join(cert_dir, 'cert.pem')
-    key_path = os.path.join(cert_dir, 'key.pem')
+import uvicorn
+from dotenv import load_dotenv
+
+from logging_config import setup_logging
+
+load_dotenv()
+
+logger = logging.getLogger("run")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Worker processes in production; defaults to the CPUs this process may run on
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+# Restart a worker after this many requests to bound memory growth; 0 disables
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+
 
-    ssl_kwargs = {}
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def ssl_options() -> dict:
+    cert_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "certs")
+    cert_path = os.path.join(cert_dir, "cert.pem")
+    key_path = os.path.join(cert_dir, "key.pem")
     if os.path.exists(cert_path) and os.path.exists(key_path):
-        ssl_kwargs = {
-            'ssl_certfile': cert_path,
-            'ssl_keyfile': key_path,
-        }
-        print("🚀 Starting Travel Planner API with HTTPS...")
-        print(f"📍 Server will be available at: https://localhost:8000")
+        return {"ssl_certfile": cert_path, "ssl_keyfile": key_path}
+    return {}
+
+
+def production_options() -> dict:
+    """Uvicorn settings for the multi-worker production profile"""
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    has_httptools = importlib.util.find_spec("httptools") is not None
+    workers = WEB_CONCURRENCY or available_cpus()
+    return {
+        "workers": workers,
+        "loop": "uvloop" if has_uvloop else "asyncio",
+        "http": "httptools" if has_httptools else "h11",
+        # A single worker runs without a supervisor to replace it, so recycling
+        # it would stop the whole server
+        "limit_max_requests": (WORKER_MAX_REQUESTS or None) if workers > 1 else None,
+        "timeout_graceful_shutdown": GRACEFUL_SHUTDOWN_SECONDS,
+        "proxy_headers": True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--production", action="store_true", default=os.getenv("APP_ENV") == "production")
+    args = parser.parse_args()
+
+    setup_logging()
+    ssl_kwargs = ssl_options()
+    scheme = "https" if ssl_kwargs else "http"
+    if args.production:
+        options = production_options()
+        logger.info(
+            "Starting Travel Planner API with %d workers (loop=%s, http=%s) at %s://%s:%d",
+            options["workers"], options["loop"], options["http"], scheme, HOST, PORT
+        )
     else:
-        print("🚀 Starting Travel Planner API without SSL...")
-        print(f"📍 Server will be available at: http://localhost:8000")
+        options = {"reload": True}
+        logger.info("Starting Travel Planner API in development mode at %s://localhost:%d", scheme, PORT)
 
+    # The app is passed as an import string so every worker (and the reloader)
+    # imports it afresh and creates its own MongoDB and LLM API clients
     uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        "main:app",
+        host=HOST,
+        port=PORT,
+        # Logging is configured by logging_config.setup_logging()
+        log_config=None,
+        **options,
         **ssl_kwargs
-    ) 
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    main()
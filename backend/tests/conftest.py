@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend modules are imported as top-level modules, as run.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Plan with the deterministic rule-based backend; no API key or network needed
+os.environ.setdefault("LLM_BACKEND", "rules")
@@ -0,0 +1,36 @@
+import asyncio
+
+from itinerary_service import regenerate_itinerary_days
+from models import ItineraryRequest
+
+
+def stored_item(item_id, day, title, **fields):
+    item = {
+        "day": day, "time": "09:00", "title": title, "description": "", "location": "", "type": "activities",
+        "duration": "2 hours", "cost": 20, "rating": 4.0, "completed": False, **fields
+    }
+    if item_id is not None:
+        item["id"] = item_id
+    return item
+
+
+def regenerate(itinerary, days):
+    request = ItineraryRequest(
+        destination="Lisbon", start_date="2026-05-01", end_date="2026-05-03", budget=600, currency="EUR",
+        travelers=2, preferences=["food"]
+    )
+    return asyncio.run(regenerate_itinerary_days(request, itinerary, days))
+
+
+def test_regenerate_tolerates_legacy_items():
+    itinerary = [
+        stored_item("a", 1, None),
+        stored_item(None, 2, "Old tram ride"),
+        stored_item("b", 2, None),
+        stored_item("c", 3, "Belem tower"),
+    ]
+    new_items, replaced_ids, days = regenerate(itinerary, [2])
+    assert days == [2]
+    # The item without an id cannot be replaced in place, so it stays
+    assert replaced_ids == ["b"]
+    assert new_items and all(item["day"] == 2 and item["id"] for item in new_items)
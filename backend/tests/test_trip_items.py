@@ -0,0 +1,17 @@
+import pytest
+from fastapi.exceptions import RequestValidationError
+
+from main import validate_item_fields
+from models import TripCollection
+
+
+@pytest.mark.parametrize("field", ["title", "cost", "day", "type", "completed"])
+def test_itinerary_patch_rejects_null(field):
+    with pytest.raises(RequestValidationError):
+        validate_item_fields(TripCollection.itinerary, {field: None})
+
+
+def test_itinerary_patch_keeps_only_given_fields():
+    assert validate_item_fields(TripCollection.itinerary, {"title": "Louvre", "cost": 0}) == {
+        "title": "Louvre", "cost": 0
+    }